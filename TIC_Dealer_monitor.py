@@ -5,18 +5,46 @@ from __future__ import annotations
 import csv
 import hashlib
 import json
+import math
 import os
 import sys
-from datetime import datetime, timezone
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
 from pathlib import Path
 from urllib.request import Request, urlopen
 
+# src/tail_reader、src/http_cache 只用標準函式庫：取最新一筆不需讀入整個 observations.csv，
+# 原始檔案沒更新時以條件式請求取得快取內容
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+from tail_reader import tail_records
+from http_cache import cached_urlopen
+
 TIC_URL = "https://ticdata.treasury.gov/resource-center/data-chart-center/tic/Documents/slt_table5.txt"
 PD_URL = "https://markets.newyorkfed.org/api/pd/get/PDPOSGST-TOT.json"
+PD_LIST_URL = "https://markets.newyorkfed.org/api/pd/list/timeseries.json"
+PD_SERIES_URL = "https://markets.newyorkfed.org/api/pd/get/{keyid}.json"
 OUT = Path(os.getenv("OUTPUT_DIR", "data"))
 OUT.mkdir(parents=True, exist_ok=True)
 HISTORY = OUT / "observations.csv"
 REPORT = OUT / "latest_report.md"
+# slt_table5 完整的 country × month 矩陣（長格式，依 (country, month) 排序）與修訂紀錄
+TIC_STORE = OUT / "tic_slt_table5.csv"
+TIC_REVISIONS = OUT / "tic_revisions.csv"
+# 上次處理過的原始內容 SHA-256；兩份都沒變就不需要重新解析與產生報告
+RAW_HASHES = OUT / "raw_hashes.json"
+# primary dealer 統計的完整歷史（長格式 keyid, asofdate, value_usd_mn，依 (keyid, asofdate) 排序）
+# 收錄 keyid 以這些前綴開頭的序列：部位（bills、各天期 coupons、TIPS、MBS…）與融資（securities in / out）
+PD_STORE = OUT / "pd_positions.csv"
+PD_SERIES_PREFIXES = ("PDPOS", "PDSI", "PDSO")
+PD_WORKERS = 8
+# 每次重抓最近幾週，讓 NY Fed 對近期數值的修正也能寫回
+PD_REVISION_WEEKS = 4
+TIC_SUMMARY_ROWS = {
+    "foreign_official_total_usd_bn": "Of Which: Foreign Official",
+    "foreign_official_bills_usd_bn": "Of Which: Foreign Official Treasury Bills",
+    "foreign_official_bonds_notes_usd_bn": "Of Which: Foreign Official T-Bonds & Notes",
+}
 
 
 def get(url: str) -> bytes:
@@ -25,41 +53,39 @@ def get(url: str) -> bytes:
     印出清楚的錯誤訊息再往外拋，讓 main() 統一處理、GitHub Actions 能顯示
     有意義的失敗原因，而不是一段原始 traceback。
     """
-    req = Request(url, headers={"User-Agent": "tic-dealer-monitor/1.0"})
     try:
-        with urlopen(req, timeout=30) as r:
-            return r.read()
+        # 帶 If-None-Match / If-Modified-Since；來源沒更新時回 304，直接使用快取內容
+        return cached_urlopen(url, headers={"User-Agent": "tic-dealer-monitor/1.0"}, timeout=30)
     except Exception as e:
         raise RuntimeError(f"抓取失敗: {url} ({type(e).__name__}: {e})") from e
 
 
-def parse_tic(raw: bytes) -> dict:
+def parse_tic_matrix(raw: bytes) -> dict[tuple[str, str], float]:
+    """
+    一次掃描 slt_table5.txt，取出所有國家（含合計列）× 所有月份的持有金額（十億美元）。
+
+    回傳 {(country, month): value}；空白或非數值的格子略過。
+    """
     try:
         rows = list(csv.reader(raw.decode("utf-8-sig").splitlines(), delimiter="\t"))
         header_i = next(i for i, row in enumerate(rows) if row and row[0] == "Country")
-        header = rows[header_i]
-        records = {}
+        months = [m.strip() for m in rows[header_i][1:]]
+        matrix = {}
         for row in rows[header_i + 1 :]:
             if not row or not row[0] or row[0].startswith("Notes:"):
                 continue
-            if row[0] in {
-                "Of Which: Foreign Official",
-                "Of Which: Foreign Official Treasury Bills",
-                "Of Which: Foreign Official T-Bonds & Notes",
-            }:
-                for month, value in zip(header[1:], row[1:]):
-                    if month and value:
-                        records[(row[0], month)] = float(value)
-        months = sorted({m for (_, m) in records})
-        month = months[-1]
-        return {
-            "source": TIC_URL,
-            "observation_date": month,
-            "foreign_official_total_usd_bn": records[("Of Which: Foreign Official", month)],
-            "foreign_official_bills_usd_bn": records[("Of Which: Foreign Official Treasury Bills", month)],
-            "foreign_official_bonds_notes_usd_bn": records[("Of Which: Foreign Official T-Bonds & Notes", month)],
-        }
-    except (StopIteration, KeyError, IndexError, ValueError) as e:
+            country = row[0].strip()
+            for month, value in zip(months, row[1:]):
+                if not month or not value.strip():
+                    continue
+                try:
+                    matrix[(country, month)] = float(value.replace(",", ""))
+                except ValueError:
+                    continue
+        if not matrix:
+            raise ValueError("找不到任何數值")
+        return matrix
+    except (StopIteration, IndexError, ValueError) as e:
         # 通常代表 Treasury 改了 slt_table5.txt 的格式（欄位名稱、分隔符號等），
         # 不是網路問題，需要人工去源頭確認新格式。
         raise RuntimeError(
@@ -68,6 +94,68 @@ def parse_tic(raw: bytes) -> dict:
         ) from e
 
 
+def summarize_tic(matrix: dict[tuple[str, str], float]) -> dict:
+    """從完整矩陣取出最新月份的三個 Foreign Official 數值（監控報告用）"""
+    try:
+        month = max(m for (country, m) in matrix if country == TIC_SUMMARY_ROWS["foreign_official_total_usd_bn"])
+        obs = {"source": TIC_URL, "observation_date": month}
+        for key, country in TIC_SUMMARY_ROWS.items():
+            obs[key] = matrix[(country, month)]
+        return obs
+    except (KeyError, ValueError) as e:
+        raise RuntimeError(
+            f"TIC 資料解析失敗，來源格式可能已變動，請人工檢查 {TIC_URL} "
+            f"({type(e).__name__}: {e})"
+        ) from e
+
+
+def parse_tic(raw: bytes) -> dict:
+    return summarize_tic(parse_tic_matrix(raw))
+
+
+def load_tic_store() -> dict[tuple[str, str], float]:
+    if not TIC_STORE.exists():
+        return {}
+    with TIC_STORE.open(newline="", encoding="utf-8") as f:
+        return {(row["country"], row["month"]): float(row["value_usd_bn"]) for row in csv.DictReader(f)}
+
+
+def update_tic_store(matrix: dict[tuple[str, str], float], retrieved_at: str) -> list[dict]:
+    """
+    把這次的矩陣合併進 TIC_STORE，並與既有數值比對找出修訂。
+
+    slt_table5 只列最近一段月份，舊月份在這裡累積成完整歷史；
+    同一 (country, month) 的數值改變即為修訂，附加到 TIC_REVISIONS。
+    回傳這次偵測到的修訂列表。
+    """
+    stored = load_tic_store()
+    revisions = [
+        {"detected_at": retrieved_at, "country": country, "month": month, "old_value_usd_bn": stored[(country, month)], "new_value_usd_bn": value}
+        for (country, month), value in matrix.items()
+        if (country, month) in stored and abs(stored[(country, month)] - value) > 1e-6
+    ]
+    if stored and not revisions and all(key in stored for key in matrix):
+        return []
+
+    stored.update(matrix)
+    tmp = TIC_STORE.with_name(TIC_STORE.name + ".tmp")
+    with tmp.open("w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["country", "month", "value_usd_bn"])
+        for (country, month), value in sorted(stored.items()):
+            w.writerow([country, month, value])
+    os.replace(tmp, TIC_STORE)
+
+    if revisions:
+        exists = TIC_REVISIONS.exists()
+        with TIC_REVISIONS.open("a", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=list(revisions[0]))
+            if not exists:
+                w.writeheader()
+            w.writerows(revisions)
+    return revisions
+
+
 def parse_pd(raw: bytes) -> dict:
     try:
         obj = json.loads(raw.decode("utf-8"))
@@ -88,11 +176,96 @@ def parse_pd(raw: bytes) -> dict:
         ) from e
 
 
+def list_pd_series() -> list[str]:
+    try:
+        obj = json.loads(get(PD_LIST_URL).decode("utf-8"))
+        return sorted({x["keyid"] for x in obj["pd"]["timeseries"] if x.get("keyid", "").startswith(PD_SERIES_PREFIXES)})
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
+        raise RuntimeError(
+            f"NY Fed dealer 序列清單解析失敗，API 回傳格式可能已變動，請人工檢查 {PD_LIST_URL} "
+            f"({type(e).__name__}: {e})"
+        ) from e
+
+
+def decode_pd_series(raw: bytes, keyid: str, after: str | None = None) -> tuple[array, array]:
+    """
+    把單一 timeseries 直接解碼成兩個 typed array：日期（date ordinal）與數值（百萬美元）。
+    只保留 after 之後的日期；不公布的數值（例如 "*"）記為 NaN。
+    """
+    dates, values = array("i"), array("d")
+    for x in json.loads(raw.decode("utf-8"))["pd"]["timeseries"]:
+        if x.get("keyid", keyid) != keyid or (after and x["asofdate"] <= after):
+            continue
+        dates.append(date.fromisoformat(x["asofdate"]).toordinal())
+        try:
+            values.append(float(x["value"]))
+        except (TypeError, ValueError):
+            values.append(math.nan)
+    return dates, values
+
+
+def load_pd_store() -> dict[tuple[str, str], float]:
+    if not PD_STORE.exists():
+        return {}
+    with PD_STORE.open(newline="", encoding="utf-8") as f:
+        return {
+            (row["keyid"], row["asofdate"]): float(row["value_usd_mn"]) if row["value_usd_mn"] else math.nan
+            for row in csv.DictReader(f)
+        }
+
+
+def ingest_pd_series(workers: int = PD_WORKERS) -> int:
+    """
+    並行抓取所有 primary dealer 序列，以 (keyid, asofdate) upsert 進 PD_STORE。
+
+    第一次執行收錄完整歷史；之後每個序列只解碼已存最大日期（往回 PD_REVISION_WEEKS 週）
+    之後的資料。回傳新增或修正的筆數。
+    """
+    store = load_pd_store()
+    latest: dict[str, str] = {}
+    for keyid, asofdate in store:
+        latest[keyid] = max(latest.get(keyid, asofdate), asofdate)
+    after = {
+        keyid: (date.fromisoformat(d) - timedelta(weeks=PD_REVISION_WEEKS)).isoformat()
+        for keyid, d in latest.items()
+    }
+
+    def fetch(keyid: str):
+        try:
+            return keyid, decode_pd_series(get(PD_SERIES_URL.format(keyid=keyid)), keyid, after.get(keyid))
+        except (RuntimeError, json.JSONDecodeError, KeyError, ValueError) as e:
+            # 單一序列失敗不影響其他序列，下次執行會再補
+            print(f"[警告] NY Fed 序列 {keyid} 抓取或解析失敗: {e}", file=sys.stderr)
+            return keyid, None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(fetch, list_pd_series()))
+
+    changed = 0
+    for keyid, decoded in results:
+        if decoded is None:
+            continue
+        for ordinal, value in zip(*decoded):
+            key = (keyid, date.fromordinal(ordinal).isoformat())
+            old = store.get(key)
+            if old is None or not (old == value or (math.isnan(old) and math.isnan(value))):
+                store[key] = value
+                changed += 1
+    if not changed:
+        return 0
+
+    tmp = PD_STORE.with_name(PD_STORE.name + ".tmp")
+    with tmp.open("w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["keyid", "asofdate", "value_usd_mn"])
+        for (keyid, asofdate), value in sorted(store.items()):
+            w.writerow([keyid, asofdate, "" if math.isnan(value) else value])
+    os.replace(tmp, PD_STORE)
+    return changed
+
+
 def previous() -> dict | None:
-    if not HISTORY.exists():
-        return None
-    with HISTORY.open(newline="") as f:
-        rows = list(csv.DictReader(f))
+    rows = tail_records(HISTORY, 1)
     return rows[-1] if rows else None
 
 
@@ -151,12 +324,41 @@ def append_observation(obs: dict) -> None:
         })
 
 
+def load_raw_hashes() -> dict:
+    if not RAW_HASHES.exists():
+        return {}
+    try:
+        return json.loads(RAW_HASHES.read_text(encoding="utf-8"))
+    except (json.JSONDecodeError, OSError):
+        return {}  # 檔案損壞就當作沒有紀錄，照常完整處理一次
+
+
+def save_raw_hashes(hashes: dict, retrieved_at: str) -> None:
+    tmp = RAW_HASHES.with_name(RAW_HASHES.name + ".tmp")
+    tmp.write_text(json.dumps({**hashes, "processed_at": retrieved_at}, indent=2) + "\n", encoding="utf-8")
+    os.replace(tmp, RAW_HASHES)
+
+
 def main() -> None:
     try:
         tic_raw = get(TIC_URL)
         pd_raw = get(PD_URL)
-        obs = {"retrieved_at": datetime.now(timezone.utc).isoformat(), "tic": parse_tic(tic_raw), "pd": parse_pd(pd_raw)}
-        obs["raw_sha256"] = {"tic": hashlib.sha256(tic_raw).hexdigest(), "pd": hashlib.sha256(pd_raw).hexdigest()}
+    except RuntimeError as e:
+        print(f"[錯誤] {e}", file=sys.stderr)
+        sys.exit(1)
+
+    # TIC 是月資料、dealer 是週資料，大部分的每日執行兩份原始內容都跟上次一樣：
+    # 直接結束，不解析、不讀 observations.csv、不重寫報告、不發 webhook
+    raw_sha256 = {"tic": hashlib.sha256(tic_raw).hexdigest(), "pd": hashlib.sha256(pd_raw).hexdigest()}
+    last = load_raw_hashes()
+    if all(last.get(key) == value for key, value in raw_sha256.items()):
+        print(f"[unchanged] TIC 與 NY Fed 原始內容與上次處理時相同（{last.get('processed_at', 'n/a')}），略過")
+        return
+
+    try:
+        tic_matrix = parse_tic_matrix(tic_raw)
+        obs = {"retrieved_at": datetime.now(timezone.utc).isoformat(), "tic": summarize_tic(tic_matrix), "pd": parse_pd(pd_raw)}
+        obs["raw_sha256"] = raw_sha256
     except RuntimeError as e:
         # get()/parse_tic()/parse_pd() 已經把錯誤訊息整理成人看得懂的句子，
         # 這裡直接印到 stderr 並以非零狀態結束，GitHub Actions 會標記這次執行失敗，
@@ -164,6 +366,15 @@ def main() -> None:
         print(f"[錯誤] {e}", file=sys.stderr)
         sys.exit(1)
 
+    revisions = update_tic_store(tic_matrix, obs["retrieved_at"])
+
+    # 完整的 primary dealer 分項歷史；失敗不影響主要監控（下次執行會再補）
+    try:
+        pd_changed = ingest_pd_series()
+    except RuntimeError as e:
+        print(f"[警告] NY Fed dealer 分項序列更新失敗: {e}", file=sys.stderr)
+        pd_changed = None
+
     old = previous()
     is_new = is_new_observation(old, obs)
 
@@ -191,6 +402,12 @@ def main() -> None:
     ]
     for name, date, value, delta in items:
         lines.append(f"| {name} | {date} | {value:,.3f} | {'n/a' if delta is None else f'{delta:+,.3f}'} |")
+    if revisions:
+        lines += ["", f"TIC revisions detected: {len(revisions)} (country, month) values changed, see {TIC_REVISIONS.name}", "", "| Country | Month | Previous (USD bn) | Revised (USD bn) |", "|---|---:|---:|---:|"]
+        for r in sorted(revisions, key=lambda r: abs(r["new_value_usd_bn"] - r["old_value_usd_bn"]), reverse=True)[:10]:
+            lines.append(f"| {r['country']} | {r['month']} | {r['old_value_usd_bn']:,.1f} | {r['new_value_usd_bn']:,.1f} |")
+    if pd_changed is not None:
+        lines += ["", f"Primary dealer series history ({PD_STORE.name}): {pd_changed} rows added or revised"]
     lines += ["", f"TIC source: [{TIC_URL}]({TIC_URL})", f"NY Fed source: [{PD_URL}]({PD_URL})", "", f"Raw TIC SHA-256: `{obs['raw_sha256']['tic']}`", f"Raw NY Fed SHA-256: `{obs['raw_sha256']['pd']}`"]
     REPORT.write_text("\n".join(lines) + "\n", encoding="utf-8")
 
@@ -208,6 +425,9 @@ def main() -> None:
             # 只印警告，不 raise。
             print(f"[警告] 警報 webhook 發送失敗，但資料已正常更新: {e}", file=sys.stderr)
 
+    # 全部處理完才記錄雜湊，途中失敗的話下次會重新處理
+    save_raw_hashes(raw_sha256, obs["retrieved_at"])
+
     print(REPORT.read_text(encoding="utf-8"))
 
 
@@ -20,6 +20,11 @@ import pandas as pd
 from datetime import datetime
 import os
 import logging
+import sys
+
+# 共用 src/ 的尾端讀取：只需新增或覆寫最後一筆時不重寫整個檔案
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from tail_reader import upsert_last_record
 
 logging.basicConfig(
     level=logging.INFO,
@@ -72,6 +77,14 @@ def update_csv(values: dict):
     """
     today_str = datetime.now().strftime("%Y-%m-%d")
 
+    # 0. 一般情況（欄位齊全、今天晚於或等於最後一筆）直接附加或覆寫檔尾
+    try:
+        if upsert_last_record(FILENAME, {"Date": today_str, **values}, "Date"):
+            logger.info(f"💾 {today_str} 已寫入 {FILENAME} 檔尾: {values}")
+            return
+    except Exception as e:
+        logger.warning(f"⚠️ 檔尾寫入失敗，改用整檔讀寫: {e}")
+
     # 1. 讀取或建立 DataFrame
     if os.path.exists(FILENAME):
         try:
@@ -8,6 +8,9 @@ futures_oi_monitor.py
    注意：CME 官方本身沒有免費即時/每日 OI，這是目前個人能拿到的免費管道，
    資料是「每週五公布、內容為前一週二」的落後資料，不是即時。
 
+CBOE PCR 歷史可依日期範圍回補（見 backfill_cboe_pcr）：
+    python cboe_pcr_scraper.py backfill 2025-01-01 2025-06-30
+
 三份資料分別存成三個 CSV，方便排程後一起 monitor：
 - cboe_pcr_history.csv
 - taifex_oi_history.csv
@@ -15,13 +18,19 @@ futures_oi_monitor.py
 """
 
 import requests
-from bs4 import BeautifulSoup
 import pandas as pd
 from datetime import datetime
 import os
-import re
 import json
 import time
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# 共用 src/ 中的 CFTC 本地鏡像（與 src/main.py、cot_scoring 同一份 TFF 數據）
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from universe import read_mirror
+from taifex_futures import load_snapshot, contract_rows
 
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
@@ -33,43 +42,107 @@ HEADERS = {
 
 
 # ---------------------------------------------------------------------------
-# 1. CBOE Put/Call Ratio（原本的邏輯，僅整理成獨立函式，行為不變）
+# 1. CBOE Put/Call Ratio
 # ---------------------------------------------------------------------------
-def get_latest_cboe_pcr():
-    """從 CBOE 網站抓取最新的每日 PCR 數據。"""
-    url = "https://www.cboe.com/markets/us/options/market-statistics/daily/"
-    headers = dict(HEADERS, Referer=url)
+_JS_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', '/': '/', '"': '"', '\\': '\\'}
+
 
+def _decode_flight_value(text: str, start: int, escaped: bool):
+    """
+    從 text[start] 開始，以括號配對掃描出一個完整的 JSON 值（物件、陣列或字串）
+
+    Next.js 的 flight payload 是包在 self.__next_f.push([1,"..."]) 字串裡的 JSON，
+    escaped=True 時先還原一層 JS 字串跳脫（\\" -> "），再做配對。
+
+    Returns:
+        (JSON 文字, 值結束後的位置)
+
+    Raises:
+        ValueError: 值沒有正常結束
+    """
+    out = []
+    depth = 0
+    in_string = False
+    json_escape = False
+    i = start
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        i += 1
+        if escaped and ch == '\\':
+            if i >= n:
+                break
+            code = text[i]
+            if code == 'u':
+                ch = chr(int(text[i + 1:i + 5], 16))
+                i += 5
+            else:
+                ch = _JS_ESCAPES.get(code, code)
+                i += 1
+        elif escaped and ch == '"':
+            # 未跳脫的引號代表外層 JS 字串結束
+            break
+        out.append(ch)
+
+        if in_string:
+            if json_escape:
+                json_escape = False
+            elif ch == '\\':
+                json_escape = True
+            elif ch == '"':
+                in_string = False
+                if depth == 0:
+                    return ''.join(out), i
+        elif ch == '"':
+            in_string = True
+        elif ch in '{[':
+            depth += 1
+        elif ch in '}]':
+            depth -= 1
+            if depth == 0:
+                return ''.join(out), i
+    raise ValueError("flight payload 中的 JSON 值不完整")
+
+
+def extract_flight_json(content: bytes, key: str, start: int = 0):
+    """
+    直接在原始回應中尋找 "key": 並解出後面的 JSON 值，不建立 DOM、不還原整段 payload
+
+    Args:
+        content: 頁面原始內容（bytes 或 str）
+        key: JSON 鍵名（例如 optionsData）
+        start: 開始搜尋的位置
+
+    Returns:
+        (解析後的值, 值結束後的位置)；找不到 key 時為 (None, -1)
+    """
+    text = content.decode('utf-8', errors='replace') if isinstance(content, bytes) else content
+    for marker, escaped in ((f'\\"{key}\\":', True), (f'"{key}":', False)):
+        pos = text.find(marker, start)
+        if pos >= 0:
+            value, end = _decode_flight_value(text, pos + len(marker), escaped)
+            return json.loads(value), end
+    return None, -1
+
+
+def parse_cboe_pcr(content: bytes):
+    """
+    從 CBOE 每日統計頁的原始內容解析 PCR
+
+    Args:
+        content: 頁面原始內容
+
+    Returns:
+        dict: {'Equity PCR', 'Index PCR', 'Equity OI PCR', 'Index OI PCR', 'Date'}；找不到數據時為 None
+    """
+    text = content.decode('utf-8', errors='replace') if isinstance(content, bytes) else content
     try:
-        time.sleep(2)
-        response = requests.get(url, headers=headers, timeout=20)
-        response.raise_for_status()
-    except requests.exceptions.RequestException as e:
-        print(f"[CBOE] 請求最新數據失敗: {e}")
+        script_data, end = extract_flight_json(text, 'optionsData')
+        actual_data_date_str, _ = extract_flight_json(text, 'selectedDate', end) if script_data else (None, -1)
+    except (ValueError, json.JSONDecodeError) as e:
+        print(f"[CBOE] JSON 解碼失敗: {e}")
         return None
 
-    soup = BeautifulSoup(response.text, 'html.parser')
-
-    script_data = None
-    actual_data_date_str = None
-
-    for script in soup.find_all('script'):
-        if script.string and 'self.__next_f.push' in script.string:
-            match = re.search(r'self\.__next_f\.push\(\[1,\"(.*)\"\]\)', script.string)
-            if match:
-                json_str_escaped = match.group(1)
-                json_str = json_str_escaped.replace('\\\"', '"').replace('\\\\n', '\\n')
-                try:
-                    data_match = re.search(r'"optionsData":(\{.*?\}),"selectedDate":"(.*?)"', json_str)
-                    if data_match:
-                        options_data_str = data_match.group(1)
-                        actual_data_date_str = data_match.group(2)
-                        script_data = json.loads(options_data_str)
-                        break
-                except json.JSONDecodeError as e:
-                    print(f"[CBOE] JSON 解碼失敗: {e}")
-                    continue
-
     if not script_data or not actual_data_date_str:
         print("[CBOE] 未找到最新數據。")
         return None
@@ -107,6 +180,156 @@ def get_latest_cboe_pcr():
     return pcr_values
 
 
+CBOE_PCR_URL = "https://www.cboe.com/markets/us/options/market-statistics/daily/"
+# 頁面以這個查詢參數指定日期（頁面數據中的 selectedDate）
+CBOE_DATE_PARAM = "dt"
+CBOE_PCR_COLUMNS = ['Date', 'Equity PCR', 'Index PCR', 'Equity OI PCR', 'Index OI PCR']
+CBOE_PCR_HISTORY = 'cboe_pcr_history.csv'
+# 回補時每天一個檔案（cboe_pcr_YYYYMMDD.csv），重跑時已有檔案的日期直接略過
+CBOE_PCR_DIR = 'cboe_pcr_data'
+# 查無數據的日期（休市日等），重跑時同樣略過
+CBOE_PCR_NO_DATA = os.path.join(CBOE_PCR_DIR, 'no_data.txt')
+# 對 www.cboe.com 的禮貌限制：同時最多幾個請求、相鄰兩個請求至少間隔幾秒
+CBOE_MAX_CONCURRENT = 2
+CBOE_MIN_INTERVAL = 1.0
+
+
+class HostLimiter:
+    """單一主機的請求限制：同時進行的請求數上限，加上相鄰請求開始時間的最小間隔"""
+
+    def __init__(self, max_concurrent, min_interval):
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._min_interval = min_interval
+        self._next_start = 0.0
+
+    def __enter__(self):
+        self._slots.acquire()
+        with self._lock:
+            wait = self._next_start - time.monotonic()
+            self._next_start = max(self._next_start, time.monotonic()) + self._min_interval
+        if wait > 0:
+            time.sleep(wait)
+        return self
+
+    def __exit__(self, *exc):
+        self._slots.release()
+
+
+def get_cboe_pcr(date=None, session=None, limiter=None):
+    """
+    抓取指定日期的 PCR
+
+    Args:
+        date: YYYY-MM-DD；None 為不帶日期參數（最新一個已發布的交易日）
+        session: requests.Session（回補時共用連線）
+        limiter: HostLimiter
+
+    Returns:
+        dict（同 parse_cboe_pcr）；'Date' 是頁面實際回傳的 selectedDate，
+        可能不是 date（該日沒有數據、尚未發布，或日期參數未生效），由呼叫端判斷
+
+    Raises:
+        requests.exceptions.RequestException: 請求失敗（由呼叫端決定是否重試）
+        ValueError: 頁面無法解析（同樣可重試，不代表該日沒有數據）
+    """
+    headers = dict(HEADERS, Referer=CBOE_PCR_URL)
+    params = {CBOE_DATE_PARAM: date} if date else None
+    with limiter or HostLimiter(1, 0):
+        response = (session or requests).get(CBOE_PCR_URL, params=params, headers=headers, timeout=20)
+    response.raise_for_status()
+    pcr = parse_cboe_pcr(response.content)
+    if pcr is None:
+        raise ValueError(f"{date or '最新'} 頁面解析失敗")
+    return pcr
+
+
+def _cboe_day_file(date):
+    return os.path.join(CBOE_PCR_DIR, f"cboe_pcr_{date.replace('-', '')}.csv")
+
+
+def _read_no_data_dates():
+    if not os.path.exists(CBOE_PCR_NO_DATA):
+        return set()
+    with open(CBOE_PCR_NO_DATA, encoding='utf-8') as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def backfill_cboe_pcr(start, end, workers=4):
+    """
+    回補一段日期的 PCR：並行抓取、每天寫一個檔案到 CBOE_PCR_DIR，
+    最後把這段期間的所有日檔一次 upsert 進 CBOE_PCR_HISTORY
+
+    已有日檔或記錄在 no_data.txt 的日期不重抓，中斷後重跑會從缺的日期繼續。
+    只有頁面回傳較早的日期、且該日早於最新已發布交易日（先不帶日期參數抓一次取得）時，
+    才視為該日沒有數據（假日）寫入 no_data.txt；其他情況（尚未發布、日期參數未生效、
+    無法取得最新日期）一律列為失敗，下次重跑再抓。
+
+    Args:
+        start: 起始日 YYYY-MM-DD
+        end: 結束日 YYYY-MM-DD（含）
+        workers: 執行緒數（實際同時請求數仍受 CBOE_MAX_CONCURRENT 限制）
+    """
+    os.makedirs(CBOE_PCR_DIR, exist_ok=True)
+    dates = [d.strftime('%Y-%m-%d') for d in pd.bdate_range(start, end)]
+    no_data = _read_no_data_dates()
+    todo = [d for d in dates if d not in no_data and not os.path.exists(_cboe_day_file(d))]
+    print(f"[CBOE] 回補 {start} ~ {end}：共 {len(dates)} 個營業日，需抓取 {len(todo)} 天")
+
+    limiter = HostLimiter(CBOE_MAX_CONCURRENT, CBOE_MIN_INTERVAL)
+    session = requests.Session()
+    try:
+        latest_date = get_cboe_pcr(None, session, limiter)['Date']
+        print(f"[CBOE] 最新已發布交易日: {latest_date}")
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"[CBOE] 無法取得最新已發布交易日，本次不記錄 no_data: {e}")
+        latest_date = None
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(get_cboe_pcr, date, session, limiter): date for date in todo}
+        for future in as_completed(futures):
+            date = futures[future]
+            try:
+                pcr = future.result()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print(f"[CBOE] {date} 抓取失敗，下次重跑時再抓: {e}")
+                failed.append(date)
+                continue
+            if pcr['Date'] == date:
+                pd.DataFrame([pcr]).to_csv(_cboe_day_file(date), index=False)
+            elif latest_date and pcr['Date'] < date < latest_date:
+                # 之後已有發布，頁面卻退回較早的日期：該日沒有數據，之後不再重抓
+                with open(CBOE_PCR_NO_DATA, 'a', encoding='utf-8') as f:
+                    f.write(date + '\n')
+            else:
+                print(f"[CBOE] {date} 頁面回傳 {pcr['Date']}（最新已發布 {latest_date}），下次重跑時再抓")
+                failed.append(date)
+
+    rows = [pd.read_csv(_cboe_day_file(d), dtype={'Date': str}) for d in dates if os.path.exists(_cboe_day_file(d))]
+    if rows:
+        _upsert_history_csv(CBOE_PCR_HISTORY, pd.concat(rows, ignore_index=True), CBOE_PCR_COLUMNS)
+    if failed:
+        print(f"[CBOE] {len(failed)} 天抓取失敗: {sorted(failed)}")
+
+
+def get_latest_cboe_pcr():
+    """從 CBOE 網站抓取最新的每日 PCR 數據。"""
+    url = CBOE_PCR_URL
+    headers = dict(HEADERS, Referer=url)
+
+    try:
+        time.sleep(2)
+        response = requests.get(url, headers=headers, timeout=20)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"[CBOE] 請求最新數據失敗: {e}")
+        return None
+
+    # 頁面數據在 Next.js flight payload 裡，直接在原始內容中定位 optionsData，不解析 HTML
+    return parse_cboe_pcr(response.content)
+
+
 # ---------------------------------------------------------------------------
 # 2. 台灣期交所 (TAIFEX) 台指期貨 (TX) 未平倉量
 # ---------------------------------------------------------------------------
@@ -114,45 +337,31 @@ def get_latest_taifex_oi(contract="TX"):
     """
     從 TAIFEX 官方 OpenAPI 抓取「期貨每日交易行情」，
     篩選出指定契約（預設 TX = 台指期貨）並加總各月份的未沖銷契約數 (OpenInterest)。
+    行情表與 taifex_monitor 共用（src/taifex_futures.py），每個交易日只下載一次。
 
     注意：openapi.taifex.com.tw 只提供「最新一個交易日」的資料，沒有歷史查詢功能，
     所以歷史走勢要靠這支腳本每天排程執行、自己累積。
     """
-    url = "https://openapi.taifex.com.tw/v1/DailyMarketReportFut"
-
     try:
-        resp = requests.get(url, headers=HEADERS, timeout=20)
-        resp.raise_for_status()
-        data = resp.json()
+        df = load_snapshot()
     except requests.exceptions.RequestException as e:
         print(f"[TAIFEX] 請求失敗: {e}")
         return None
-    except json.JSONDecodeError as e:
-        print(f"[TAIFEX] JSON 解碼失敗: {e}")
-        return None
-
-    if not data:
-        print("[TAIFEX] 未取得任何資料。")
+    except ValueError as e:
+        print(f"[TAIFEX] JSON 解碼失敗或未取得任何資料: {e}")
         return None
 
-    df = pd.DataFrame(data)
-
     if 'Contract' not in df.columns or 'OpenInterest' not in df.columns:
         print(f"[TAIFEX] 回傳欄位與預期不符，實際欄位: {list(df.columns)}")
         return None
 
-    df_contract = df[df['Contract'].str.strip() == contract].copy()
+    df_contract = contract_rows(df, contract)
     if df_contract.empty:
         print(f"[TAIFEX] 找不到契約代碼 {contract}，實際出現的代碼: {df['Contract'].unique()[:20]}")
         return None
 
-    # OpenInterest 欄位是字串，且可能含逗號，先清理再轉數字
-    df_contract['OpenInterest'] = (
-        df_contract['OpenInterest'].astype(str).str.replace(',', '').replace('', '0')
-    )
-    df_contract['OpenInterest'] = pd.to_numeric(df_contract['OpenInterest'], errors='coerce').fillna(0)
-
-    total_oi = int(df_contract['OpenInterest'].sum())
+    # 快照中的 OpenInterest 已是數值（"-" 為 NaN）
+    total_oi = int(df_contract['OpenInterest'].fillna(0).sum())
     date_str = str(df_contract['Date'].iloc[0]) if 'Date' in df_contract.columns else datetime.now().strftime("%Y%m%d")
 
     return {
@@ -172,7 +381,21 @@ def get_latest_cme_oi(cftc_contract_market_code="13874A"):
 
     注意：這是「每週」資料（每週五公布、內容為前一週二的部位），
     不是 CME 官方的每日/即時 OI；CME 官方即時/完整歷史 OI 是付費服務。
+
+    優先讀取本地 TFF 鏡像（由 src/main.py 更新，這裡只讀取），鏡像無法使用時才直接查詢 API。
     """
+    try:
+        df = read_mirror('tff', columns=['market_name', 'open_interest'], markets=[cftc_contract_market_code])
+        if not df.empty:
+            row = df.sort_values('report_date').iloc[-1]
+            return {
+                'Date': pd.Timestamp(row['report_date']).strftime('%Y-%m-%d'),
+                'Contract': row['market_name'],
+                'OpenInterestAll': str(int(row['open_interest'])),
+            }
+    except Exception as e:
+        print(f"[CME/CFTC] 本地鏡像讀取失敗，改為直接查詢 API: {e}")
+
     url = "https://publicreporting.cftc.gov/resource/gpe5-46if.json"
     params = {
         "$where": f"cftc_contract_market_code='{cftc_contract_market_code}'",
@@ -206,11 +429,8 @@ def get_latest_cme_oi(cftc_contract_market_code="13874A"):
 # ---------------------------------------------------------------------------
 # 通用：讀取既有 CSV -> 合併新資料 -> 去重 -> 存回
 # ---------------------------------------------------------------------------
-def _update_history_csv(history_file, latest_row, columns, date_col='Date'):
-    if latest_row is None:
-        print(f"未取得新數據，略過更新 {history_file}。")
-        return
-
+def _upsert_history_csv(history_file, df_new, columns, date_col='Date'):
+    """把多筆新資料一次合併進歷史檔（同日期以新資料為準），依日期由新到舊存回"""
     if os.path.exists(history_file):
         df_history = pd.read_csv(
          history_file,
@@ -219,24 +439,29 @@ def _update_history_csv(history_file, latest_row, columns, date_col='Date'):
     else:
         df_history = pd.DataFrame(columns=columns)
 
-    df_latest = pd.DataFrame([latest_row])
-
-    df_combined = pd.concat([df_history, df_latest], ignore_index=True)
+    df_combined = pd.concat([df_history, df_new], ignore_index=True)
     df_combined = df_combined.drop_duplicates(subset=[date_col], keep='last')
     df_combined = df_combined.sort_values(date_col, ascending=False)
-    df_combined = df_combined.head(1000)
 
     df_combined.to_csv(history_file, index=False)
     print(f"數據已更新至 {history_file}，共 {len(df_combined)} 條記錄。")
 
 
+def _update_history_csv(history_file, latest_row, columns, date_col='Date'):
+    if latest_row is None:
+        print(f"未取得新數據，略過更新 {history_file}。")
+        return
+
+    _upsert_history_csv(history_file, pd.DataFrame([latest_row]), columns, date_col)
+
+
 def main():
     print("=== 1/3 抓取 CBOE Put/Call Ratio ===")
     cboe_data = get_latest_cboe_pcr()
     _update_history_csv(
-        'cboe_pcr_history.csv',
+        CBOE_PCR_HISTORY,
         cboe_data,
-        columns=['Date', 'Equity PCR', 'Index PCR', 'Equity OI PCR', 'Index OI PCR'],
+        columns=CBOE_PCR_COLUMNS,
     )
 
     print("\n=== 2/3 抓取台指期 (TX) 未平倉量 ===")
@@ -257,4 +482,9 @@ def main():
 
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'backfill':
+        # python cboe_pcr_scraper.py backfill 2025-01-01 2025-06-30 [workers]
+        backfill_cboe_pcr(sys.argv[2], sys.argv[3], *(int(w) for w in sys.argv[4:5]))
+        sys.exit(0)
+
     main()
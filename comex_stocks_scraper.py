@@ -18,23 +18,32 @@ COMEX 倉儲庫存抓取器
     （Pledged 是 Registered 底下的子集合，不重複累加）。
 
     報告日期從表頭 "Report Date: M/D/YYYY" 文字解析。
+    以 xlrd 直接讀儲存格，單次掃描，四行加總都找到就停止。
 
 輸出：comex_gold_stocks.csv / comex_silver_stocks.csv
     欄位：report_date, registered, pledged, eligible, combined_total
+輸出：comex_depository_stocks.csv（各 depository 明細，長格式，每天以 upsert 累積）
+    欄位：date, metal, depository, category, field, value
 
 用法：
     pip install requests pandas xlrd
     python comex_stocks_scraper.py
 """
 
+from __future__ import annotations
+
 import re
 import os
+import sys
 import logging
-from io import BytesIO
 from datetime import datetime
 
-import requests
 import pandas as pd
+import xlrd
+
+# 共用 src/ 的條件式請求快取：報告沒更新時伺服器回 304，不必重新下載 .xls
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+from http_cache import cached_get
 
 logging.basicConfig(
     level=logging.INFO,
@@ -60,6 +69,8 @@ HEADERS = {
     "Referer": "https://www.cmegroup.com/markets/metals/precious/gold.html",
 }
 
+SHEET_NAME = "Daily Metal Stocks Report"
+
 # TOTAL TODAY 欄位的欄位索引（col0=depository/label名稱, col2=PREV TOTAL, col7=TOTAL TODAY）
 COL_LABEL = 0
 COL_TOTAL_TODAY = 7
@@ -71,51 +82,79 @@ TARGET_LABELS = {
     "COMBINED TOTAL": "combined_total",
 }
 
+# 報告日期出現在表頭，只掃描前幾列的所有欄位；其餘列只看 COL_LABEL
+HEADER_ROWS = 20
+REPORT_DATE_RE = re.compile(r"Report Date:\s*(\d{1,2})/(\d{1,2})/(\d{4})")
+
+# 各 depository 明細：名稱列之後是 Registered / Pledged / Eligible / Total 各一列，
+# 數值欄位依表頭文字對應（PREV TOTAL, RECEIVED, WITHDRAWN, NET CHANGE, ADJUSTMENT, TOTAL TODAY）
+DEPOSITORY_FILE = "comex_depository_stocks.csv"
+DEPOSITORY_COLUMNS = ["date", "metal", "depository", "category", "field", "value"]
+DEPOSITORY_CATEGORIES = {"REGISTERED", "PLEDGED", "ELIGIBLE", "TOTAL"}
+
 
-def parse_report_date(df_raw: pd.DataFrame) -> str:
+def parse_report_date(text: str) -> str | None:
     """
-    從表格內容裡找出 "Report Date: M/D/YYYY" 這種文字並解析成 YYYY-MM-DD
+    從 "Report Date: M/D/YYYY" 這種文字解析成 YYYY-MM-DD
 
     Args:
-        df_raw: 完整原始表格（header=None讀入）
+        text: 儲存格文字
 
     Returns:
-        str: YYYY-MM-DD 格式的日期字串
-
-    Raises:
-        ValueError: 找不到報告日期時拋出，避免寫入錯誤/空白的日期
+        str: YYYY-MM-DD 格式的日期字串；不是報告日期文字時回傳 None
     """
-    for _, row in df_raw.iterrows():
-        for cell in row:
-            if isinstance(cell, str) and "Report Date" in cell:
-                match = re.search(r"Report Date:\s*(\d{1,2})/(\d{1,2})/(\d{4})", cell)
-                if match:
-                    month, day, year = match.groups()
-                    return f"{year}-{int(month):02d}-{int(day):02d}"
-    raise ValueError("在報告裡找不到 'Report Date:' 文字，表格結構可能變了")
+    match = REPORT_DATE_RE.search(text)
+    if not match:
+        return None
+    month, day, year = match.groups()
+    return f"{year}-{int(month):02d}-{int(day):02d}"
+
+
+def cell_number(sheet, row: int, col: int) -> float | None:
+    """讀取數值儲存格；空白回傳 None"""
+    cell = sheet.cell(row, col)
+    if cell.ctype == xlrd.XL_CELL_NUMBER:
+        return float(cell.value)
+    text = str(cell.value).replace(",", "").strip()
+    return float(text) if text else None
 
 
-def parse_totals(df_raw: pd.DataFrame) -> dict:
+def parse_totals(sheet) -> dict:
     """
-    從表格裡找出 TOTAL REGISTERED / TOTAL PLEDGED / TOTAL ELIGIBLE / COMBINED TOTAL 四行
+    單次掃描工作表：從表頭找出報告日期，從 COL_LABEL 找出
+    TOTAL REGISTERED / TOTAL PLEDGED / TOTAL ELIGIBLE / COMBINED TOTAL 四行，
+    四行都找到就停止，不讀取其餘的儲存格
 
     Args:
-        df_raw: 完整原始表格（header=None讀入）
+        sheet: xlrd 工作表（open_workbook(on_demand=True) 載入）
 
     Returns:
-        dict: {"registered": float, "pledged": float or None,
+        dict: {"report_date": str, "registered": float, "pledged": float or None,
                "eligible": float, "combined_total": float}
+
+    Raises:
+        ValueError: 找不到報告日期或必要的加總列（表格結構可能變了）
     """
     results = {}
-    for _, row in df_raw.iterrows():
-        label = row[COL_LABEL]
-        if not isinstance(label, str):
-            continue
-        label_clean = label.strip().upper()
-        if label_clean in TARGET_LABELS:
-            key = TARGET_LABELS[label_clean]
-            value = row[COL_TOTAL_TODAY]
-            results[key] = float(value) if pd.notna(value) else None
+    report_date = None
+    for r in range(sheet.nrows):
+        if report_date is None and r < HEADER_ROWS:
+            for cell in sheet.row_values(r):
+                if isinstance(cell, str) and "Report Date" in cell:
+                    report_date = parse_report_date(cell)
+                    if report_date:
+                        break
+
+        label = sheet.cell_value(r, COL_LABEL)
+        if isinstance(label, str):
+            key = TARGET_LABELS.get(label.strip().upper())
+            if key:
+                results[key] = cell_number(sheet, r, COL_TOTAL_TODAY)
+                if len(results) == len(TARGET_LABELS):
+                    break
+
+    if report_date is None:
+        raise ValueError("在報告裡找不到 'Report Date:' 文字，表格結構可能變了")
 
     missing = set(["registered", "eligible", "combined_total"]) - set(results.keys())
     if missing:
@@ -130,40 +169,95 @@ def parse_totals(df_raw: pd.DataFrame) -> dict:
             f"報告結構可能有變化，請人工確認"
         )
 
+    results["report_date"] = report_date
     return results
 
 
-def fetch_and_parse(metal: str) -> dict:
+def parse_depositories(sheet, report_date: str, metal: str) -> pd.DataFrame:
+    """
+    一次讀出整張表的欄位，向量化整理成每個 depository 的長格式明細
+
+    Args:
+        sheet: xlrd 工作表
+        report_date: 報告日期 (YYYY-MM-DD)
+        metal: "gold" / "silver"
+
+    Returns:
+        DataFrame[date, metal, depository, category, field, value]，
+        category 為 registered / pledged / eligible / total，空白數值不列出
+
+    Raises:
+        ValueError: 找不到含 "TOTAL TODAY" 的表頭列
+    """
+    table = pd.DataFrame([sheet.col_values(c) for c in range(sheet.ncols)]).T
+    text = table.astype(str).apply(lambda col: col.str.strip().str.upper())
+
+    header_rows = text.index[text.eq("TOTAL TODAY").any(axis=1)]
+    if header_rows.empty:
+        raise ValueError("在報告裡找不到 'TOTAL TODAY' 表頭，表格結構可能變了")
+    header = text.loc[header_rows[0]]
+    fields = {
+        c: re.sub(r"\W+", "_", header[c].lower()).strip("_")
+        for c in table.columns if c != COL_LABEL and header[c]
+    }
+
+    body = table.loc[header_rows[0] + 1:]
+    labels = text.loc[body.index, COL_LABEL]
+    values = body[list(fields)].apply(
+        lambda col: pd.to_numeric(col.astype(str).str.replace(",", "").str.strip(), errors="coerce")
+    )
+
+    # 沒有任何數值的文字列是 depository 名稱；加總列（TOTAL REGISTERED...）之後不再有明細
+    is_name = values.isna().all(axis=1) & labels.ne("") & ~labels.isin(DEPOSITORY_CATEGORIES)
+    named = body[COL_LABEL].where(is_name).ffill()
+    depository = named.astype(str).str.strip()
+    before_totals = ~labels.isin(list(TARGET_LABELS)).cummax()
+    rows = labels.isin(DEPOSITORY_CATEGORIES) & named.notna() & before_totals
+
+    wide = values[rows].rename(columns=fields)
+    wide.insert(0, "category", labels[rows].str.lower())
+    wide.insert(0, "depository", depository[rows])
+    long = wide.melt(id_vars=["depository", "category"], var_name="field", value_name="value").dropna(subset=["value"])
+    long.insert(0, "metal", metal)
+    long.insert(0, "date", report_date)
+    return long[DEPOSITORY_COLUMNS].reset_index(drop=True)
+
+
+def fetch_and_parse(metal: str) -> tuple[dict, pd.DataFrame | None]:
     """
     下載並解析單一金屬的 COMEX 倉儲報告
 
     Returns:
-        dict: {"report_date": str, "registered": float, "pledged": float,
-               "eligible": float, "combined_total": float}
+        tuple: (加總 {"report_date": str, "registered": float, "pledged": float,
+                      "eligible": float, "combined_total": float},
+                depository 明細（見 parse_depositories），解析失敗時為 None)
     """
     config = METALS[metal]
     logger.info(f"下載 {metal} 報告: {config['url']}")
 
-    resp = requests.get(config["url"], headers=HEADERS, timeout=30)
+    resp = cached_get(config["url"], headers=HEADERS, timeout=30)
     resp.raise_for_status()
 
-    df_raw = pd.read_excel(
-        BytesIO(resp.content),
-        sheet_name="Daily Metal Stocks Report",
-        header=None,
-        engine="xlrd",
-    )
-
-    report_date = parse_report_date(df_raw)
-    totals = parse_totals(df_raw)
-    totals["report_date"] = report_date
+    # on_demand：只載入需要的工作表，不建立整張表的 DataFrame
+    book = xlrd.open_workbook(file_contents=resp.content, on_demand=True)
+    try:
+        sheet = book.sheet_by_name(SHEET_NAME)
+        totals = parse_totals(sheet)
+        try:
+            depositories = parse_depositories(sheet, totals["report_date"], metal)
+        except Exception as e:
+            # 明細只是附加資料，解析失敗不影響加總
+            logger.warning(f"⚠️ {metal} depository 明細解析失敗: {e}")
+            depositories = None
+    finally:
+        book.release_resources()
 
-    logger.info(f"✅ {metal} {report_date}: "
+    logger.info(f"✅ {metal} {totals['report_date']}: "
                 f"registered={totals['registered']:.0f}, "
                 f"eligible={totals['eligible']:.0f}, "
                 f"combined_total={totals['combined_total']:.0f}")
 
-    return totals
+    return totals, depositories
 
 
 def update_csv(metal: str, data: dict):
@@ -201,12 +295,34 @@ def update_csv(metal: str, data: dict):
         raise
 
 
+def update_depository_csv(depositories: pd.DataFrame):
+    """
+    把單日的 depository 明細 upsert 到長格式歷史檔：
+    同一 (date, metal) 的舊資料整批換成這次的內容（depository 可能新增或消失）
+    """
+    key = ["date", "metal"]
+    if os.path.exists(DEPOSITORY_FILE):
+        history = pd.read_csv(DEPOSITORY_FILE)
+        replaced = history.set_index(key).index.isin(depositories.set_index(key).index)
+        history = pd.concat([history[~replaced], depositories], ignore_index=True)
+    else:
+        history = depositories
+
+    history = history.sort_values(["date", "metal", "depository", "category", "field"], kind="stable")
+    tmp_file = f"{DEPOSITORY_FILE}.tmp"
+    history.to_csv(tmp_file, index=False)
+    os.replace(tmp_file, DEPOSITORY_FILE)
+    logger.info(f"💾 depository 明細 {len(depositories)} 筆已儲存至 {DEPOSITORY_FILE}")
+
+
 def main():
     failed = []
     for metal in METALS:
         try:
-            data = fetch_and_parse(metal)
+            data, depositories = fetch_and_parse(metal)
             update_csv(metal, data)
+            if depositories is not None and not depositories.empty:
+                update_depository_csv(depositories)
         except Exception as e:
             logger.error(f"❌ 處理 {metal} 失敗: {e}", exc_info=True)
             failed.append(metal)
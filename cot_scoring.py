@@ -1,18 +1,102 @@
+import os
+import sys
 import cot_reports as cot
 import pandas as pd
 import numpy as np
-from datetime import datetime
+import re
+import json
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
 
-def get_sp500_cot_data(years=[2023, 2024, 2025]):
+# 共用 src/ 中的 CFTC 本地鏡像（與 src/main.py、cboe_pcr_scraper 同一份數據）
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from universe import read_mirror, latest_release_time
+
+SP500_MARKET_CODE = '13874A'  # E-MINI S&P 500 - CHICAGO MERCANTILE EXCHANGE
+SP500_MARKET_NAME = 'E-MINI S&P 500 - CHICAGO MERCANTILE EXCHANGE'
+TFF_REPORT_TYPE = 'traders_in_financial_futures_fut'
+
+# cot_reports 年度檔的快取（只存篩選後的單一市場）
+# 過去年份內容不會再變動，快取後永不重新下載；今年的快取在下一次 CFTC 發布後才重新下載
+COT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'cot_reports_cache')
+COT_CACHE_MANIFEST = os.path.join(COT_CACHE_DIR, 'manifest.json')
+# 前一年的最後一份報告最晚在隔年一月上旬發布，此日之後寫入的快取視為定案
+FINAL_AFTER = (1, 15)
+
+def _cot_cache_path(year, report_type, market_name):
+    slug = re.sub(r'[^0-9A-Za-z]+', '_', market_name).strip('_').lower()
+    return os.path.join(COT_CACHE_DIR, f"{report_type}_{slug}_{year}.csv")
+
+def _load_cot_cache_manifest():
+    """快取檔名 -> 下載時間 (UTC ISO)；不用檔案 mtime，因為 git checkout 會重設 mtime"""
+    if not os.path.exists(COT_CACHE_MANIFEST):
+        return {}
+    with open(COT_CACHE_MANIFEST, encoding='utf-8') as f:
+        return json.load(f)
+
+def _is_cot_cache_fresh(path, year, manifest):
+    """
+    判斷年度快取是否可直接使用
+    - 在該年度定案（隔年 1/15）之後下載的快取：永久有效
+    - 其他（今年，或去年底下載的去年）：下載時間晚於最近一次 CFTC 發布即有效
+    """
+    fetched_at = manifest.get(os.path.basename(path))
+    if fetched_at is None or not os.path.exists(path):
+        return False
+    fetched_at = datetime.fromisoformat(fetched_at)
+    if fetched_at >= datetime(year + 1, *FINAL_AFTER, tzinfo=fetched_at.tzinfo):
+        return True
+    return fetched_at >= latest_release_time()
+
+def get_cot_year_cached(year, report_type=TFF_REPORT_TYPE, market_name=SP500_MARKET_NAME):
+    """
+    以 cot_reports 取得單一年度、單一市場的數據，篩選後存入磁碟快取
+    """
+    path = _cot_cache_path(year, report_type, market_name)
+    manifest = _load_cot_cache_manifest()
+    if _is_cot_cache_fresh(path, year, manifest):
+        return pd.read_csv(path)
+
+    df = cot.cot_year(year, cot_report_type=report_type)
+    target = df[df['Market_and_Exchange_Names'] == market_name].copy()
+
+    os.makedirs(COT_CACHE_DIR, exist_ok=True)
+    target.to_csv(f"{path}.tmp", index=False)
+    os.replace(f"{path}.tmp", path)
+
+    manifest[os.path.basename(path)] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    with open(f"{COT_CACHE_MANIFEST}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(f"{COT_CACHE_MANIFEST}.tmp", COT_CACHE_MANIFEST)
+    return pd.read_csv(path)
+
+def get_sp500_cot_data(years=[2023, 2024, 2025], source='mirror'):
     """
     獲取 S&P 500 E-mini 的 COT 數據 (TFF 報告)
+
+    source='mirror' 時從本地 TFF 鏡像讀取（由 src/main.py 更新，這裡只讀取），
+    鏡像尚未涵蓋的較早年份，或鏡像無法使用時，改用 cot_reports 下載年度檔
     """
+    if source == 'mirror':
+        try:
+            mirror_df = get_sp500_cot_data_from_mirror(years)
+            first_date = mirror_df['date'].min()
+            # 鏡像的第一年通常只涵蓋部分（從建立時的窗口起）；第一週之後才開始的年份也由 cot_reports 補齊
+            covered_from = first_date.year if first_date.dayofyear <= 7 else first_date.year + 1
+            older_years = [year for year in years if year < covered_from]
+            if not older_years:
+                return mirror_df
+            older_df = get_sp500_cot_data(older_years, source='cot_reports')
+            return pd.concat([older_df[older_df['date'] < first_date], mirror_df], ignore_index=True)
+        except Exception as e:
+            print(f"本地鏡像讀取失敗，改用 cot_reports: {e}")
+
     all_data = []
     for year in years:
         try:
-            df = cot.cot_year(year, cot_report_type='traders_in_financial_futures_fut')
-            # 篩選 E-MINI S&P 500
-            target = df[df['Market_and_Exchange_Names'] == 'E-MINI S&P 500 - CHICAGO MERCANTILE EXCHANGE'].copy()
+            # 篩選 E-MINI S&P 500（過去年份讀取磁碟快取）
+            target = get_cot_year_cached(year)
             all_data.append(target)
         except Exception as e:
             print(f"無法獲取 {year} 數據: {e}")
@@ -34,15 +118,61 @@ def get_sp500_cot_data(years=[2023, 2024, 2025]):
     
     return full_df[['date', 'mm_net', 'comm_net', 'oi']]
 
-def calculate_scores(df):
+def get_sp500_cot_data_from_mirror(years):
+    """
+    從本地 TFF 鏡像讀取 S&P 500 E-mini 的數據，欄位與 get_sp500_cot_data 相同
+    """
+    df = read_mirror('tff', columns=[
+        'open_interest',
+        'lev_money_positions_long', 'lev_money_positions_short',
+        'dealer_positions_long_all', 'dealer_positions_short_all',
+    ], markets=[SP500_MARKET_CODE])
+    df = df[df['report_date'].dt.year.isin(years)].sort_values('report_date')
+    if df.empty:
+        raise ValueError(f"鏡像中沒有 {years} 的數據")
+
+    return pd.DataFrame({
+        'date': df['report_date'],
+        'mm_net': df['lev_money_positions_long'] - df['lev_money_positions_short'],
+        'comm_net': df['dealer_positions_long_all'] - df['dealer_positions_short_all'],
+        'oi': df['open_interest'],
+    }).reset_index(drop=True)
+
+def get_tff_cot_data(years, markets=None):
+    """
+    從本地 TFF 鏡像讀取多個市場的長格式數據 (date, market, market_name, mm_net, comm_net, oi)
+    markets 為 cftc_contract_market_code 列表，None 為所有 TFF 市場
+    """
+    df = read_mirror('tff', columns=[
+        'market_name', 'open_interest',
+        'lev_money_positions_long', 'lev_money_positions_short',
+        'dealer_positions_long_all', 'dealer_positions_short_all',
+    ], markets=markets)
+    df = df[df['report_date'].dt.year.isin(years)]
+
+    return pd.DataFrame({
+        'date': df['report_date'],
+        'market': df['market'],
+        'market_name': df['market_name'],
+        'mm_net': df['lev_money_positions_long'] - df['lev_money_positions_short'],
+        'comm_net': df['dealer_positions_long_all'] - df['dealer_positions_short_all'],
+        'oi': df['open_interest'],
+    }).reset_index(drop=True)
+
+def calculate_scores(df, window=52):
     """
     打分邏輯:
     1. MM Z-score > |2| -> +10
     2. Commercial 站反向 -> +5
     3. OI 下滑 (相較上週) -> +5
+
+    df 含 'market' 欄（get_tff_cot_data 的長格式）時，一次計算所有市場，
+    回傳 (date × market) 的得分矩陣，見 calculate_market_scores
     """
+    if 'market' in df.columns:
+        return calculate_market_scores(df, window)
+
     # 1. MM Z-score (使用 52 週滾動窗口)
-    window = 52
     df['mm_mean'] = df['mm_net'].rolling(window=window).mean()
     df['mm_std'] = df['mm_net'].rolling(window=window).std()
     df['mm_zscore'] = (df['mm_net'] - df['mm_mean']) / df['mm_std']
@@ -63,7 +193,173 @@ def calculate_scores(df):
     
     return df
 
+def calculate_market_scores(df, window=52):
+    """
+    多市場版本的 calculate_scores，打分邏輯相同
+    以 groupby().rolling() 在單一向量化運算中完成所有市場各自的滾動窗口，
+    不在 Python 中逐一迴圈市場
+
+    回傳 (date × market) 的得分矩陣；某市場在該日沒有數據時為 NaN
+    """
+    df = (df.drop_duplicates(subset=['market', 'date'], keep='last')
+            .sort_values(['market', 'date'])
+            .reset_index(drop=True))
+    grouped = df.groupby('market', sort=False)
+
+    # 1. MM Z-score（各市場各自的滾動窗口；結果的第一層索引為市場，去掉後與 df 對齊）
+    rolling = grouped['mm_net'].rolling(window=window)
+    mm_mean = rolling.mean().reset_index(level=0, drop=True)
+    mm_std = rolling.std().reset_index(level=0, drop=True)
+    mm_zscore = (df['mm_net'] - mm_mean) / mm_std
+
+    # 2. Commercial 分歧
+    comm_divergence = df['mm_net'] * df['comm_net'] < 0
+
+    # 3. OI 變化（各市場各自與上週比較）
+    oi_down = grouped['oi'].diff() < 0
+
+    score = (mm_zscore.abs() > 2) * 10 + comm_divergence * 5 + oi_down * 5
+    return df.assign(score=score).pivot(index='date', columns='market', values='score')
+
+# ---------------------------------------------------------------------------
+# 參數掃描：windows × z 門檻 × 權重，對照 S&P 500 的未來報酬
+# ---------------------------------------------------------------------------
+SWEEP_WINDOWS = [13, 26, 39, 52, 78, 104]
+SWEEP_Z_THRESHOLDS = [1.0, 1.5, 2.0, 2.5, 3.0]
+# (MM Z-score, Commercial 分歧, OI 下滑) 的加分
+SWEEP_WEIGHTS = [
+    (10, 5, 5), (10, 0, 0), (10, 5, 0), (10, 0, 5),
+    (5, 5, 5), (10, 10, 5), (10, 5, 10), (20, 5, 5),
+]
+
+def forward_returns(dates, close, horizon_weeks=4):
+    """
+    各 COT 報告的未來報酬：報告日（週二）的部位於週五公布，以公布日收盤進場，持有 horizon_weeks 週
+    dates 需由舊到新排序；close 為以日期為索引的收盤價；尚無出場價的報告為 NaN
+    """
+    prices = close.rename('price').rename_axis('t').reset_index().sort_values('t')
+    entry_dates = pd.DataFrame({'t': pd.to_datetime(dates).values + np.timedelta64(3, 'D')})
+    exit_dates = pd.DataFrame({'t': entry_dates['t'] + pd.Timedelta(weeks=horizon_weeks)})
+    entry = pd.merge_asof(entry_dates, prices, on='t', direction='forward')['price']
+    exit_ = pd.merge_asof(exit_dates, prices, on='t', direction='forward')['price']
+    return (exit_ / entry - 1).to_numpy()
+
+def get_sp500_close(start, ticker='^GSPC'):
+    """以 yfinance 抓取 S&P 500 的每日收盤價（索引為不含時區的日期）"""
+    import yfinance as yf
+    close = yf.Ticker(ticker).history(start=start.strftime('%Y-%m-%d'))['Close']
+    close.index = pd.to_datetime(close.index).tz_localize(None).normalize()
+    return close
+
+def _sweep_window(window, mm_net, comm_divergence, oi_down, forward_return, z_thresholds, weights):
+    """
+    單一 window 長度的掃描（在子行程中執行）
+    滾動平均/標準差只算一次，所有 z 門檻 × 權重組合以陣列廣播一次算出得分並評估
+    """
+    mm = pd.Series(mm_net)
+    rolling = mm.rolling(window=window)
+    z_abs = ((mm - rolling.mean()) / rolling.std()).abs().to_numpy()
+
+    valid = ~np.isnan(z_abs) & ~np.isnan(forward_return)
+    z_abs, ret = z_abs[valid], forward_return[valid]
+    comm, oi = comm_divergence[valid].astype(float), oi_down[valid].astype(float)
+
+    thresholds = np.asarray(z_thresholds, dtype=float)
+    w = np.asarray(weights, dtype=float)  # K × 3
+    # n × T × K：每筆報告在每個門檻、每組權重下的得分
+    z_flags = (z_abs[:, None] > thresholds[None, :]).astype(float)
+    scores = (z_flags[:, :, None] * w[None, None, :, 0]
+              + comm[:, None, None] * w[None, None, :, 1]
+              + oi[:, None, None] * w[None, None, :, 2])
+    scores = scores.reshape(len(ret), -1)
+
+    # IC：得分與未來報酬的相關係數（所有組合一次以矩陣運算）
+    centered = scores - scores.mean(axis=0)
+    ret_centered = ret - ret.mean()
+    denom = np.sqrt((centered ** 2).sum(axis=0) * (ret_centered ** 2).sum())
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ic = (centered * ret_centered[:, None]).sum(axis=0) / denom
+
+    # 訊號：所有權重大於 0 的條件同時成立（得分達到上限）
+    max_score = np.clip(w, 0, None).sum(axis=1)
+    signals = scores >= np.tile(max_score, len(thresholds))[None, :]
+    n_signals = signals.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        signal_return = (signals * ret[:, None]).sum(axis=0) / n_signals
+
+    grid_thresholds = np.repeat(thresholds, len(w))
+    grid_weights = np.tile(w, (len(thresholds), 1))
+    return pd.DataFrame({
+        'window': window,
+        'z_threshold': grid_thresholds,
+        'w_zscore': grid_weights[:, 0],
+        'w_comm': grid_weights[:, 1],
+        'w_oi': grid_weights[:, 2],
+        'n_obs': len(ret),
+        'ic': ic,
+        'n_signals': n_signals,
+        'signal_return': signal_return,
+        'excess_return': signal_return - ret.mean(),
+    })
+
+def sweep_scores(df, forward_return, windows=SWEEP_WINDOWS, z_thresholds=SWEEP_Z_THRESHOLDS,
+                 weights=SWEEP_WEIGHTS, max_workers=None, rank_by='ic', ascending=True):
+    """
+    對整個參數網格評估 calculate_scores 的得分與未來報酬的關係
+    每個 window 長度分派到一個子行程（滾動統計只算一次），與 window 無關的
+    Commercial 分歧與 OI 下滑只在這裡算一次
+
+    df: get_sp500_cot_data 的輸出（由舊到新排序）
+    forward_return: 與 df 對齊的未來報酬（見 forward_returns）
+    rank_by / ascending: 排序欄位；預設 IC 由小到大（擁擠度越高、未來報酬越差排越前）
+
+    回傳依 rank_by 排序、含 rank 欄的結果表
+    """
+    mm_net = df['mm_net'].to_numpy(dtype=float)
+    comm_divergence = (df['mm_net'] * df['comm_net'] < 0).to_numpy()
+    oi_down = (df['oi'].diff() < 0).to_numpy()
+    worker = partial(
+        _sweep_window,
+        mm_net=mm_net,
+        comm_divergence=comm_divergence,
+        oi_down=oi_down,
+        forward_return=np.asarray(forward_return, dtype=float),
+        z_thresholds=list(z_thresholds),
+        weights=list(weights),
+    )
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = pd.concat(executor.map(worker, windows), ignore_index=True)
+
+    results = results.sort_values(rank_by, ascending=ascending, na_position='last').reset_index(drop=True)
+    results.insert(0, 'rank', np.arange(1, len(results) + 1))
+    return results
+
+def run_sweep(years=None, horizon_weeks=4):
+    """掃描模式：抓取數據與 S&P 500 價格，執行參數掃描並儲存排名表"""
+    current_year = datetime.now().year
+    years = years or list(range(current_year - 10, current_year + 1))
+    print(f"正在抓取 COT 歷史數據 ({years[0]}-{years[-1]})...")
+    cot_df = get_sp500_cot_data(years=years).sort_values('date').reset_index(drop=True)
+
+    print("正在抓取 S&P 500 價格並計算未來報酬...")
+    close = get_sp500_close(cot_df['date'].min())
+    forward_return = forward_returns(cot_df['date'], close, horizon_weeks)
+
+    print(f"正在掃描 {len(SWEEP_WINDOWS) * len(SWEEP_Z_THRESHOLDS) * len(SWEEP_WEIGHTS)} 組參數...")
+    results = sweep_scores(cot_df, forward_return)
+
+    print(f"\n參數掃描結果（未來 {horizon_weeks} 週報酬，前 20 名）:")
+    print(results.head(20).to_string(index=False))
+    results.to_csv("cot_sweep_results.csv", index=False)
+    print("\n數據已儲存至 cot_sweep_results.csv")
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'sweep':
+        # python cot_scoring.py sweep
+        run_sweep()
+        sys.exit(0)
+
     print("正在抓取 COT 歷史數據並計算得分...")
     # 獲取最近三年的數據以計算 Z-score
     cot_df = get_sp500_cot_data(years=[2023, 2024, 2025, 2026])
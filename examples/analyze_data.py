@@ -21,12 +21,22 @@ def load_data(commodity: str) -> pd.DataFrame:
     
     Args:
         commodity: 商品名稱 ('gold', 'silver', 'sp500')
-        
+    
     Returns:
         DataFrame
     """
-    file_path = DATA_DIR / f"{commodity}_cot_data.csv"
-    df = pd.read_csv(file_path, parse_dates=['report_date'])
+    # 有欄式檔案（src/config.py 的 STORAGE_BACKEND）時優先讀取，日期已是原生型別不需解析
+    for suffix, reader in (('.parquet', pd.read_parquet), ('.feather', pd.read_feather)):
+        columnar_path = DATA_DIR / f"{commodity}_cot_data{suffix}"
+        if columnar_path.exists():
+            try:
+                df = reader(columnar_path)
+                break
+            except ImportError:
+                continue
+    else:
+        file_path = DATA_DIR / f"{commodity}_cot_data.csv"
+        df = pd.read_csv(file_path, parse_dates=['report_date'])
     df.sort_values('report_date', inplace=True)
     return df
 
@@ -10,6 +10,23 @@ from datetime import datetime
 DATA_DIR = Path(__file__).parent.parent / "data"
 
 
+def load_columnar(csv_path: Path):
+    """
+    讀取與 CSV 同名的欄式檔案（.parquet / .feather），日期已是原生型別不需解析
+    
+    Returns:
+        DataFrame，沒有欄式檔案或未安裝 pyarrow 時回傳 None
+    """
+    for suffix, reader in (('.parquet', pd.read_parquet), ('.feather', pd.read_feather)):
+        columnar_path = csv_path.with_suffix(suffix)
+        if columnar_path.exists():
+            try:
+                return reader(columnar_path)
+            except ImportError:
+                continue
+    return None
+
+
 def view_latest():
     """顯示所有商品的最新 COT 數據"""
     
@@ -31,8 +48,10 @@ def view_latest():
             continue
         
         try:
-            df = pd.read_csv(file_path)
-            df['report_date'] = pd.to_datetime(df['report_date'])
+            df = load_columnar(file_path)
+            if df is None:
+                df = pd.read_csv(file_path)
+                df['report_date'] = pd.to_datetime(df['report_date'])
             df.sort_values('report_date', ascending=False, inplace=True)
             
             latest = df.iloc[0]
@@ -58,7 +77,7 @@ def view_latest():
                 print(f"   週變化:   {arrow} {change:+,} 口 ({change_pct:+.2f}%)")
             
             print()
-            
+        
         except Exception as e:
             print(f"❌ {name}: 讀取數據時發生錯誤 - {e}\n")
     
@@ -2,8 +2,13 @@ import requests
 import pandas as pd
 from datetime import datetime
 import os
+import sys
 from bs4 import BeautifulSoup
 
+# 共用 src/ 的尾端讀取：只需新增或覆寫最後一筆時不重寫整個檔案
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from tail_reader import upsert_last_record
+
 # 設定檔案名稱
 FILE_NAME = 'jp10y_history.csv'
 
@@ -40,7 +45,12 @@ def update_csv():
 
     print(f"✅ 抓取成功: {today_str} -> {yield_val}%")
 
-    # 2. 讀取現有 CSV (如果存在)
+    # 2. 一般情況（今天晚於或等於最後一筆）直接附加或覆寫檔尾
+    if upsert_last_record(FILE_NAME, {'Date': today_str, 'JP10Y': yield_val}, 'Date'):
+        print(f"💾 數據已寫入 {FILE_NAME}")
+        return
+
+    # 3. 其他情況讀取現有 CSV (如果存在)
     if os.path.exists(FILE_NAME):
         df = pd.read_csv(FILE_NAME)
         # 檢查今天是否已經存過了 (避免重複執行導致重複數據)
@@ -55,7 +65,7 @@ def update_csv():
         print("📁 建立新檔案...")
         df = pd.DataFrame([{'Date': today_str, 'JP10Y': yield_val}])
 
-    # 3. 存回 CSV
+    # 4. 存回 CSV
     df.to_csv(FILE_NAME, index=False)
     print(f"💾 數據已寫入 {FILE_NAME}")
 
@@ -1,17 +1,21 @@
 import yfinance as yf
 import pandas as pd
-import requests
 from io import StringIO
 import os
+import sys
 from datetime import datetime
 
+# 共用 src/ 的條件式請求快取：DIX.csv 沒更新時伺服器回 304，不必重新下載整份歷史
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from http_cache import cached_get
+
 def get_gex_history():
     """
     從 SqueezeMetrics 獲取 SPX GEX 歷史數據 (免費公開源)
     """
     url = "https://squeezemetrics.com/monitor/static/DIX.csv"
     headers = {'User-Agent': 'Mozilla/5.0'}
-    response = requests.get(url, headers=headers)
+    response = cached_get(url, headers=headers)
     if response.status_code == 200:
         df = pd.read_csv(StringIO(response.text))
         df['date'] = pd.to_datetime(df['date'])
@@ -1,17 +1,23 @@
-import requests
 import pandas as pd
 import json
 import os
+import sys
 import matplotlib.pyplot as plt
 from datetime import datetime
 
+# 共用 src/ 的條件式請求快取
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from http_cache import cached_get
+
 # 中央銀行 API 網址 (全體銀行放款餘額統計表 - 借戶行業別 - 月)
 # 包含「週轉金」用途的詳細數據
 API_URL = "https://cpx.cbc.gov.tw/API/DataAPI/Get?FileName=EI87M01"
+# 月資料；API 沒有 ETag / Last-Modified 時，同一天內重跑直接使用快取
+CACHE_TTL = 12 * 3600
 
 def fetch_data():
     print(f"Fetching data from {API_URL}...")
-    response = requests.get(API_URL)
+    response = cached_get(API_URL, ttl=CACHE_TTL)
     response.raise_for_status()
     return response.json()
 
@@ -1,9 +1,14 @@
 import csv
 import os
+import sys
 import requests
 import time
 from datetime import datetime
 
+# 共用 src/ 的尾端讀取：檢查今天是否已存在只需讀檔尾，不需讀入 1983 年以來的整個檔案
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from tail_reader import date_exists
+
 # WTI 原油數據監控程式 (V5 - 1-Year Spread 版)
 # 對齊財經 M 平方 (MM) 的邏輯：一年後價格 (1-Year Out) 減去 近期價格 (Front Month)
 CSV_FILENAME = "wti_monitor_data.csv"
@@ -77,16 +82,13 @@ def main():
         
         # 儲存數據
         file_exists = os.path.isfile(CSV_FILENAME)
-        existing_dates = set()
+        already_saved = False
         if file_exists:
             try:
-                with open(CSV_FILENAME, mode='r', encoding='utf-8-sig') as f:
-                    reader = csv.DictReader(f)
-                    for row in reader:
-                        if row.get('Date'): existing_dates.add(row['Date'])
+                already_saved = date_exists(CSV_FILENAME, result['date'], 'Date')
             except: pass
             
-        if result['date'] in existing_dates:
+        if already_saved:
             print(f"[{datetime.now()}] {result['date']} 的數據已存在，跳過儲存。")
             return
 
@@ -1,15 +1,22 @@
-import requests
 import pandas as pd
 import os
+import sys
 from datetime import datetime
 
+# 共用 src/ 的條件式請求快取
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from http_cache import cached_get
+
+# FRED 週/月資料；沒有 ETag / Last-Modified 時，同一天內重跑直接使用快取
+FRED_CACHE_TTL = 12 * 3600
+
 def fetch_fred_data(series_id):
     """從 FRED 抓取數據"""
     url = f"https://fred.stlouisfed.org/graph/fredgraph.csv?id={series_id}"
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
     }
-    response = requests.get(url, headers=headers)
+    response = cached_get(url, headers=headers, ttl=FRED_CACHE_TTL)
     response.raise_for_status()
     
     # 讀取 CSV
@@ -0,0 +1,312 @@
+"""
+COTDataProcessor 離線效能基準測試
+以合成的 COT 歷史數據與 API 回傳資料，量測各處理階段與完整 update 流程的
+執行時間與記憶體峰值，結果輸出為 JSON，方便比較儲存或合併邏輯修改前後的差異
+
+用法（在 src/ 目錄下執行）:
+    python benchmark.py --markets 1 10 100 --years 20 --output before.json
+    python benchmark.py --markets 1 10 100 --years 20 --output after.json --compare before.json
+"""
+
+import argparse
+import json
+import logging
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from data_processor import COTDataProcessor
+
+logger = logging.getLogger(__name__)
+
+# 合成數據使用的欄位與最新報告日期（固定，讓每次執行結果可比較）
+LONG_FIELD = 'm_money_positions_long_all'
+SHORT_FIELD = 'm_money_positions_short_all'
+LATEST_REPORT_DATE = datetime(2026, 1, 6)
+
+# 模擬 API 回傳中其他不需要的欄位
+PAYLOAD_NOISE_FIELDS = {
+    'market_and_exchange_names': 'GOLD - COMMODITY EXCHANGE INC.',
+    'commodity_name': 'GOLD',
+    'contract_market_name': 'GOLD',
+    'futonly_or_combined': 'FutOnly',
+    'cftc_contract_market_code': '088691',
+}
+
+STAGES = ['process_data', 'load_existing_data', 'merge_data', 'save_data', 'update', 'update_full_merge']
+
+
+def report_dates(weeks: int, latest: datetime = LATEST_REPORT_DATE) -> List[str]:
+    """由新到舊的每週報告日期 (YYYY-MM-DD)"""
+    return [(latest - timedelta(weeks=i)).strftime('%Y-%m-%d') for i in range(weeks)]
+
+
+def synthetic_history(years: int, seed: int = 0) -> pd.DataFrame:
+    """
+    產生與 data/*_cot_data.csv 相同格式的合成歷史數據
+    
+    Args:
+        years: 歷史年數（每年 52 週）
+        seed: 亂數種子
+    
+    Returns:
+        依日期由新到舊排序的 DataFrame（不含最新一週，留給 payload 當作新報告）
+    """
+    rng = np.random.default_rng(seed)
+    weeks = years * 52
+    open_interest = 400000 + rng.integers(-20000, 20000, weeks).cumsum() // 10
+    long_positions = 150000 + rng.integers(-5000, 5000, weeks).cumsum() // 10
+    short_positions = 50000 + rng.integers(-3000, 3000, weeks).cumsum() // 10
+    return pd.DataFrame({
+        'report_date': report_dates(weeks + 1)[1:],
+        'open_interest': np.abs(open_interest),
+        'long_positions': np.abs(long_positions),
+        'short_positions': np.abs(short_positions),
+        'net_positions': np.abs(long_positions) - np.abs(short_positions),
+    })
+
+
+def synthetic_payload(weeks: int, seed: int = 0) -> List[Dict]:
+    """
+    產生模擬 API 回傳的原始資料（數值為字串、日期為 ISO 時間戳，與 Socrata 相同）
+    
+    Args:
+        weeks: 包含的週數（最新一週為新報告，其餘與歷史重疊）
+        seed: 亂數種子
+    
+    Returns:
+        字典列表
+    """
+    rng = np.random.default_rng(seed + 1)
+    rows = []
+    for date in report_dates(weeks):
+        row = {
+            'report_date_as_yyyy_mm_dd': f"{date}T00:00:00.000",
+            'open_interest_all': str(int(rng.integers(300000, 500000))),
+            LONG_FIELD: str(int(rng.integers(100000, 200000))),
+            SHORT_FIELD: str(int(rng.integers(20000, 80000))),
+        }
+        row.update(PAYLOAD_NOISE_FIELDS)
+        rows.append(row)
+    return rows
+
+
+def measure(func: Callable[[], None], setup: Optional[Callable[[], None]] = None, repeat: int = 3) -> Dict:
+    """
+    量測執行時間與記憶體峰值
+    
+    計時與記憶體分開量測：tracemalloc 本身會拖慢執行，只在最後額外執行一次時開啟。
+    
+    Args:
+        func: 要量測的函數
+        setup: 每次執行前呼叫（不計入時間），用於還原檔案狀態
+        repeat: 計時次數
+    
+    Returns:
+        {'seconds_min', 'seconds_median', 'peak_memory_bytes'}
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    
+    return {
+        'seconds_min': min(timings),
+        'seconds_median': statistics.median(timings),
+        'peak_memory_bytes': peak,
+    }
+
+
+def run_scenario(
+    workdir: Path,
+    markets: int,
+    years: int,
+    payload_weeks: int,
+    backend: str,
+    repeat: int
+) -> List[Dict]:
+    """
+    對 markets 個市場（各自一個檔案，與 COMMODITIES 的配置方式相同）量測各階段
+    
+    Returns:
+        每個階段一筆結果；時間與記憶體為所有市場合計
+    """
+    scenario_dir = workdir / f"{backend}_{markets}x{years}y"
+    scenario_dir.mkdir(parents=True)
+    
+    processors = [
+        COTDataProcessor({
+            'output_file': scenario_dir / f"market_{i:04d}.csv",
+            'long_field': LONG_FIELD,
+            'short_field': SHORT_FIELD,
+            'storage_backend': backend,
+        })
+        for i in range(markets)
+    ]
+    
+    # 產生一次歷史數據檔案作為基準，每次量測前以複製方式還原
+    pristine = {}
+    for i, processor in enumerate(processors):
+        processor.save_data(synthetic_history(years, seed=i))
+        pristine[processor] = [
+            (path, path.with_name(f"{path.name}.orig"))
+            for path in {processor.output_file, Path(processor.storage.path)}
+        ]
+        for path, backup in pristine[processor]:
+            shutil.copyfile(path, backup)
+    
+    def restore():
+        for files in pristine.values():
+            for path, backup in files:
+                shutil.copyfile(backup, path)
+    
+    payloads = {p: synthetic_payload(payload_weeks, seed=i) for i, p in enumerate(processors)}
+    processed = {p: p.process_data(payloads[p]) for p in processors}
+    existing = {p: p.load_existing_data() for p in processors}
+    merged = {p: p.merge_data(processed[p], existing[p]) for p in processors}
+    
+    def update_full_merge(processor):
+        new = processor.process_data(payloads[processor])
+        processor.save_data(processor.merge_data(new, processor.load_existing_data()))
+    
+    stages = {
+        'process_data': (lambda: [p.process_data(payloads[p]) for p in processors], None),
+        'load_existing_data': (lambda: [p.load_existing_data() for p in processors], None),
+        'merge_data': (lambda: [p.merge_data(processed[p], existing[p]) for p in processors], None),
+        'save_data': (lambda: [p.save_data(merged[p]) for p in processors], restore),
+        'update': (lambda: [p.update(payloads[p]) for p in processors], restore),
+        'update_full_merge': (lambda: [update_full_merge(p) for p in processors], restore),
+    }
+    
+    results = []
+    for stage in STAGES:
+        func, setup = stages[stage]
+        result = measure(func, setup, repeat)
+        result.update({
+            'stage': stage,
+            'backend': backend,
+            'markets': markets,
+            'years': years,
+            'history_rows': years * 52 * markets,
+            'payload_rows': payload_weeks * markets,
+        })
+        results.append(result)
+        print(
+            f"{backend:8s} {markets:5d} 市場 x {years:2d} 年  {stage:18s} "
+            f"{result['seconds_median'] * 1000:10.1f} ms  {result['peak_memory_bytes'] / 1e6:8.1f} MB"
+        )
+    
+    shutil.rmtree(scenario_dir)
+    return results
+
+
+def result_key(result: Dict) -> tuple:
+    """用於比較兩次結果的鍵"""
+    return (result['backend'], result['markets'], result['years'], result['payload_rows'], result['stage'])
+
+
+def compare(results: List[Dict], baseline: List[Dict]):
+    """列出與基準結果相比的時間與記憶體倍數（小於 1 表示變快/變省）"""
+    base = {result_key(r): r for r in baseline}
+    print("\n與基準比較（時間倍數 / 記憶體倍數）")
+    for result in results:
+        old = base.get(result_key(result))
+        if old is None:
+            continue
+        time_ratio = result['seconds_median'] / old['seconds_median'] if old['seconds_median'] else float('nan')
+        mem_ratio = result['peak_memory_bytes'] / old['peak_memory_bytes'] if old['peak_memory_bytes'] else float('nan')
+        print(
+            f"{result['backend']:8s} {result['markets']:5d} 市場 x {result['years']:2d} 年  "
+            f"{result['stage']:18s} {time_ratio:6.2f}x  {mem_ratio:6.2f}x"
+        )
+
+
+def run_benchmark(
+    markets: List[int],
+    years: List[int],
+    payload_weeks: int = 5,
+    backends: List[str] = ('csv',),
+    repeat: int = 3
+) -> Dict:
+    """
+    執行所有情境
+    
+    Args:
+        markets: 市場數列表
+        years: 歷史年數列表
+        payload_weeks: 每次更新的 API 資料週數（含一週新報告，其餘與歷史重疊）
+        backends: 儲存後端列表（見 storage.create_storage）
+        repeat: 每個階段的計時次數
+    
+    Returns:
+        {'environment': ..., 'parameters': ..., 'results': [...]}
+    """
+    results = []
+    with tempfile.TemporaryDirectory(prefix='cot_benchmark_') as workdir:
+        for backend in backends:
+            for n_years in years:
+                for n_markets in markets:
+                    results.extend(run_scenario(Path(workdir), n_markets, n_years, payload_weeks, backend, repeat))
+    
+    return {
+        'environment': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+        },
+        'parameters': {
+            'markets': list(markets),
+            'years': list(years),
+            'payload_weeks': payload_weeks,
+            'backends': list(backends),
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="COTDataProcessor 離線效能基準測試")
+    parser.add_argument("--markets", type=int, nargs='+', default=[1, 10, 100], help="市場數（可多個，例如 1 10 100 1000）")
+    parser.add_argument("--years", type=int, nargs='+', default=[20], help="每個市場的歷史年數")
+    parser.add_argument("--payload-weeks", type=int, default=5, help="每次更新的 API 資料週數")
+    parser.add_argument("--backends", nargs='+', default=['csv'], help="儲存後端：csv、parquet、feather")
+    parser.add_argument("--repeat", type=int, default=3, help="每個階段的計時次數")
+    parser.add_argument("--output", default="benchmark_results.json", help="結果 JSON 檔案路徑")
+    parser.add_argument("--compare", help="與先前的結果 JSON 比較")
+    args = parser.parse_args()
+    
+    # 處理器每一步都會記錄 INFO 日誌，基準測試時關閉以免影響計時
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
+    report = run_benchmark(args.markets, args.years, args.payload_weeks, args.backends, args.repeat)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n結果已儲存至: {args.output}")
+    
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(report['results'], json.load(f)['results'])
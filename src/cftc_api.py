@@ -4,12 +4,21 @@ CFTC API 客戶端
 """
 
 import requests
+import random
 import time
 from typing import Dict, List, Optional
-from datetime import datetime, timedelta
+from datetime import datetime
 import logging
 
-from config import APP_TOKEN, REQUEST_TIMEOUT, MAX_RETRIES, RETRY_DELAY, PAGE_SIZE
+import pandas as pd
+
+from config import (
+    APP_TOKEN, REQUEST_TIMEOUT, MAX_RETRIES, RETRY_DELAY, RETRY_MAX_DELAY, PAGE_SIZE, COMMON_FIELDS
+)
+from json_stream import TypedColumns
+
+# 串流解碼時每次讀取的位元組數
+STREAM_CHUNK_SIZE = 64 * 1024
 
 # 設置日誌
 logging.basicConfig(
@@ -41,7 +50,8 @@ class CFTCAPIClient:
         filter_value: str,
         start_date: Optional[str] = None,
         limit: int = PAGE_SIZE,
-        extra_filters: Optional[Dict[str, str]] = None
+        extra_filters: Optional[Dict[str, str]] = None,
+        select_fields: Optional[List[str]] = None
     ) -> List[Dict]:
         """
         從 CFTC API 獲取數據（使用 GET 方法和 SoQL 查詢參數）
@@ -55,33 +65,196 @@ class CFTCAPIClient:
             extra_filters: 額外篩選條件字典（可選），例如
                 {'contract_market_name': 'GOLD', 'futonly_or_combined': 'FutOnly'}，
                 用於消除同一 commodity_name 底下混雜多個合約/report type 的問題
+            select_fields: 要回傳的欄位列表（$select），為 None 時回傳所有欄位
             
         Returns:
             包含 COT 數據的字典列表
         """
-        # 構建 SoQL WHERE 子句
-        where_clause = f"{filter_field} = '{filter_value}'"
-        if extra_filters:
-            for extra_field, extra_value in extra_filters.items():
-                where_clause += f" AND {extra_field} = '{extra_value}'"
-        if start_date:
-            where_clause += f" AND report_date_as_yyyy_mm_dd >= '{start_date}'"
-        
         # 使用 GET 方法和查詢參數
-        params = {
-            '$where': where_clause,
-            '$order': 'report_date_as_yyyy_mm_dd DESC',
-            '$limit': limit
-        }
-        
-        if self.app_token:
-            params['$$app_token'] = self.app_token
+        params = _data_params(filter_field, filter_value, start_date, limit, extra_filters, select_fields)
         
         logger.info(f"正在獲取數據: {filter_value}")
+        logger.debug(f"WHERE 子句: {params['$where']}")
+        
+        data = self._get(api_endpoint, params, label=filter_value)
+        
+        # 檢查是否有數據
+        if not data:
+            logger.warning(f"未找到 {filter_value} 的數據")
+            return []
+        
+        logger.info(f"成功獲取 {len(data)} 筆 {filter_value} 數據")
+        return data
+    
+    def fetch_batch(
+        self,
+        api_endpoint: str,
+        filter_field: str,
+        filter_values: List[str],
+        start_date: Optional[str] = None,
+        limit: int = PAGE_SIZE,
+        extra_filters: Optional[Dict[str, List[str]]] = None,
+        select_fields: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """
+        以單一 SoQL 查詢（`IN (...)`）一次獲取同一端點底下多個商品的數據
+        
+        結果筆數可能超過單頁上限，因此以 $offset 分頁直到取完為止；
+        回傳的資料列未依商品拆分，由呼叫端依篩選值在本地切分。
+        
+        Args:
+            api_endpoint: API 端點 URL
+            filter_field: 篩選欄位名稱
+            filter_values: 篩選值列表
+            start_date: 起始日期 (YYYY-MM-DD)
+            limit: 每頁記錄數
+            extra_filters: 額外篩選條件，值為允許值列表，例如
+                {'futonly_or_combined': ['FutOnly']}
+            select_fields: 要回傳的欄位列表（$select），為 None 時回傳所有欄位
+            
+        Returns:
+            包含所有篩選值之 COT 數據的字典列表
+        """
+        where_clause = _in_where_clause(filter_field, filter_values, extra_filters, start_date)
+        
+        label = ', '.join(filter_values)
+        logger.info(f"正在批次獲取數據: {label}")
+        
+        rows = self.fetch_pages(api_endpoint, where_clause, limit, select_fields, label=label)
+        
+        logger.info(f"成功批次獲取 {len(rows)} 筆數據 ({label})")
+        return rows
+    
+    def fetch_pages(
+        self,
+        api_endpoint: str,
+        where_clause: str,
+        limit: int = PAGE_SIZE,
+        select_fields: Optional[List[str]] = None,
+        label: str = ''
+    ) -> List[Dict]:
+        """
+        依任意 WHERE 子句以 $offset 分頁取回所有資料列
+        
+        Args:
+            api_endpoint: API 端點 URL
+            where_clause: SoQL WHERE 子句
+            limit: 每頁記錄數
+            select_fields: 要回傳的欄位列表（$select），為 None 時回傳所有欄位
+            label: 日誌中用來辨識此請求的名稱
+            
+        Returns:
+            所有分頁的字典列表
+        """
         logger.debug(f"WHERE 子句: {where_clause}")
         
+        rows: List[Dict] = []
+        offset = 0
+        while True:
+            params = _page_params(where_clause, limit, offset, select_fields)
+            page = self._get(api_endpoint, params, label=label or api_endpoint)
+            rows.extend(page)
+            if len(page) < limit:
+                break
+            offset += limit
+        return rows
+    
+    def fetch_columns(
+        self,
+        api_endpoint: str,
+        where_clause: str,
+        fields: Dict[str, str],
+        limit: int = PAGE_SIZE,
+        label: str = ''
+    ) -> pd.DataFrame:
+        """
+        分頁取回資料，並以串流方式直接解碼成型別化欄位
+        
+        與 fetch_pages 不同，回應不會先轉成 dict 列表：每頁邊下載邊解析，
+        只保留 fields 中的欄位並寫入預先配置的 NumPy 陣列，
+        適合全市場或多年份的大量查詢。
+        
+        Args:
+            api_endpoint: API 端點 URL
+            where_clause: SoQL WHERE 子句
+            fields: {API 欄位名稱: 型別}，型別為 'date'、'float' 或 'str'；同時作為 $select
+            limit: 每頁記錄數（也是欄位陣列的初始容量）
+            label: 日誌中用來辨識此請求的名稱
+            
+        Returns:
+            以 API 欄位名稱為欄的 DataFrame
+        """
+        columns = TypedColumns(fields, capacity=limit)
+        offset = 0
+        while True:
+            params = _page_params(where_clause, limit, offset, list(fields))
+            count = self._get(api_endpoint, params, label=label or api_endpoint, columns=columns)
+            if count < limit:
+                break
+            offset += limit
+        return columns.to_frame()
+    
+    @staticmethod
+    def build_select(commodity_configs: List[Dict]) -> List[str]:
+        """
+        依商品配置組出 $select 欄位列表
+        
+        包含報告日期、未平倉量、各商品的多空欄位、篩選欄位
+        （批次模式需要在本地依此切分），以及配置中額外指定的 extra_fields。
+        
+        Args:
+            commodity_configs: 商品配置列表
+            
+        Returns:
+            不重複且保持順序的欄位名稱列表
+        """
+        fields = list(COMMON_FIELDS.keys())
+        for config in commodity_configs:
+            fields.append(config['filter_field'])
+            for extra_field in ('contract_market_name', 'futonly_or_combined'):
+                if config.get(extra_field):
+                    fields.append(extra_field)
+            fields.extend([config['long_field'], config['short_field']])
+            fields.extend(config.get('extra_fields', []))
+        return list(dict.fromkeys(fields))
+    
+    def _get(
+        self,
+        api_endpoint: str,
+        params: Dict,
+        label: str,
+        columns: Optional[TypedColumns] = None
+    ):
+        """
+        發送 GET 請求，失敗時重試
+        
+        Args:
+            api_endpoint: API 端點 URL
+            params: SoQL 查詢參數
+            label: 日誌中用來辨識此請求的名稱
+            columns: 指定時以串流方式把回應解碼進這個欄位容器
+            
+        Returns:
+            API 回傳的字典列表；指定 columns 時回傳本次加入的筆數
+        """
+        if self.app_token:
+            params['$$app_token'] = self.app_token
+        start = columns.length if columns is not None else 0
+        
         for attempt in range(MAX_RETRIES):
             try:
+                if columns is not None:
+                    # 重試時丟掉上一次不完整的分頁
+                    columns.truncate(start)
+                    with self.session.get(
+                        api_endpoint,
+                        params=params,
+                        timeout=REQUEST_TIMEOUT,
+                        stream=True
+                    ) as response:
+                        response.raise_for_status()
+                        return columns.extend_from_json(response.iter_content(STREAM_CHUNK_SIZE))
+                
                 # 使用 GET 方法
                 response = self.session.get(
                     api_endpoint,
@@ -90,23 +263,17 @@ class CFTCAPIClient:
                 )
                 response.raise_for_status()
                 
-                data = response.json()
-                
-                # 檢查是否有數據
-                if not data:
-                    logger.warning(f"未找到 {filter_value} 的數據")
-                    return []
-                
-                logger.info(f"成功獲取 {len(data)} 筆 {filter_value} 數據")
-                return data
+                return response.json()
                 
             except requests.exceptions.RequestException as e:
                 logger.error(f"API 請求失敗 (嘗試 {attempt + 1}/{MAX_RETRIES}): {e}")
                 if attempt < MAX_RETRIES - 1:
-                    logger.info(f"等待 {RETRY_DELAY} 秒後重試...")
-                    time.sleep(RETRY_DELAY)
+                    retry_after = e.response.headers.get('Retry-After') if e.response is not None else None
+                    delay = backoff_delay(attempt, retry_after)
+                    logger.info(f"等待 {delay:.1f} 秒後重試...")
+                    time.sleep(delay)
                 else:
-                    logger.error(f"達到最大重試次數，放棄獲取 {filter_value} 數據")
+                    logger.error(f"達到最大重試次數，放棄獲取 {label} 數據")
                     raise
         
         return []
@@ -139,15 +306,209 @@ class CFTCAPIClient:
             # 提取日期
             date_str = data[0].get('report_date_as_yyyy_mm_dd')
             if date_str:
-                # 轉換為 YYYY-MM-DD 格式
-                try:
-                    dt = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-                    return dt.strftime('%Y-%m-%d')
-                except (ValueError, AttributeError):
-                    return date_str.split('T')[0] if 'T' in date_str else date_str
+                return _normalize_date(date_str)
         
         return None
     
+    def get_latest_report_dates(
+        self,
+        api_endpoint: str,
+        filter_field: str,
+        filter_values: List[str],
+        extra_filters: Optional[Dict[str, List[str]]] = None
+    ) -> List[Dict]:
+        """
+        以單一聚合查詢取得端點上各篩選值的最新報告日期（新鮮度探測）
+        
+        只回傳 `max(report_date_as_yyyy_mm_dd)` 與分組欄位，資料量極小，
+        用於在完整抓取前判斷是否有新報告。
+        
+        Args:
+            api_endpoint: API 端點 URL
+            filter_field: 篩選欄位名稱
+            filter_values: 篩選值列表
+            extra_filters: 額外篩選條件，值為允許值列表；這些欄位也會加入分組
+            
+        Returns:
+            字典列表，每筆包含分組欄位與 'latest_report_date' (YYYY-MM-DD)
+        """
+        params = _probe_params(filter_field, filter_values, extra_filters)
+        
+        label = ', '.join(filter_values)
+        logger.info(f"正在探測最新報告日期: {label}")
+        rows = self._get(api_endpoint, params, label=label)
+        
+        return _normalize_probe_rows(rows)
+    
+    def discover_markets(
+        self,
+        api_endpoint: str,
+        extra_filters: Optional[Dict[str, str]] = None
+    ) -> List[Dict]:
+        """
+        列出端點上所有合約市場及各自的最新報告日期（聚合查詢，以 $offset 分頁）
+        
+        Args:
+            api_endpoint: API 端點 URL
+            extra_filters: 額外篩選條件字典，例如 {'futonly_or_combined': 'FutOnly'}
+            
+        Returns:
+            字典列表，每筆包含 cftc_contract_market_code、market_and_exchange_names
+            與 'latest_report_date' (YYYY-MM-DD)
+        """
+        logger.info(f"正在列出所有合約市場: {api_endpoint}")
+        rows: List[Dict] = []
+        offset = 0
+        while True:
+            page = self._get(api_endpoint, _discover_params(extra_filters, PAGE_SIZE, offset), label=api_endpoint)
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                break
+            offset += PAGE_SIZE
+        return _normalize_probe_rows(rows)
+    
     def close(self):
         """關閉 session"""
         self.session.close()
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """
+    計算第 attempt 次失敗後的重試等待秒數
+    
+    伺服器有給 Retry-After（例如 429）時優先遵守，否則採用
+    full-jitter 指數退避：在 [0, min(RETRY_MAX_DELAY, RETRY_DELAY * 2^attempt)] 間隨機取值，
+    避免多個並行請求在同一時間點一起重試。
+    
+    Args:
+        attempt: 已失敗的次數（從 0 開始）
+        retry_after: 伺服器回傳的 Retry-After 標頭（秒數），可選
+        
+    Returns:
+        等待秒數
+    """
+    if retry_after:
+        try:
+            return min(float(retry_after), RETRY_MAX_DELAY)
+        except ValueError:
+            pass
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_DELAY * (2 ** attempt)))
+
+
+def _data_params(
+    filter_field: str,
+    filter_value: str,
+    start_date: Optional[str] = None,
+    limit: int = PAGE_SIZE,
+    extra_filters: Optional[Dict[str, str]] = None,
+    select_fields: Optional[List[str]] = None
+) -> Dict:
+    """單一商品查詢的 SoQL 參數"""
+    # 構建 SoQL WHERE 子句
+    where_clause = f"{filter_field} = '{filter_value}'"
+    if extra_filters:
+        for extra_field, extra_value in extra_filters.items():
+            where_clause += f" AND {extra_field} = '{extra_value}'"
+    if start_date:
+        where_clause += f" AND report_date_as_yyyy_mm_dd >= '{start_date}'"
+    
+    params = {
+        '$where': where_clause,
+        '$order': 'report_date_as_yyyy_mm_dd DESC',
+        '$limit': limit
+    }
+    if select_fields:
+        params['$select'] = ', '.join(select_fields)
+    return params
+
+
+def _in_where_clause(
+    filter_field: str,
+    filter_values: List[str],
+    extra_filters: Optional[Dict[str, List[str]]] = None,
+    start_date: Optional[str] = None
+) -> str:
+    """組出 `field IN (...)` 形式的 SoQL WHERE 子句"""
+    where_clause = f"{filter_field} IN ({_soql_list(filter_values)})"
+    for extra_field, extra_values in (extra_filters or {}).items():
+        where_clause += f" AND {extra_field} IN ({_soql_list(extra_values)})"
+    if start_date:
+        where_clause += f" AND report_date_as_yyyy_mm_dd >= '{start_date}'"
+    return where_clause
+
+
+def _page_params(
+    where_clause: str,
+    limit: int,
+    offset: int,
+    select_fields: Optional[List[str]] = None
+) -> Dict:
+    """批次查詢單一分頁的 SoQL 參數"""
+    params = {
+        '$where': where_clause,
+        # 加上系統欄位 :id 作為次要排序鍵，確保分頁結果穩定不重疊
+        '$order': 'report_date_as_yyyy_mm_dd DESC, :id',
+        '$limit': limit,
+        '$offset': offset
+    }
+    if select_fields:
+        params['$select'] = ', '.join(select_fields)
+    return params
+
+
+def _probe_params(
+    filter_field: str,
+    filter_values: List[str],
+    extra_filters: Optional[Dict[str, List[str]]] = None
+) -> Dict:
+    """新鮮度探測（各分組最新報告日期）的 SoQL 參數"""
+    group_fields = [filter_field] + list(extra_filters or {})
+    return {
+        '$select': ', '.join(group_fields + ['max(report_date_as_yyyy_mm_dd) AS latest_report_date']),
+        '$where': _in_where_clause(filter_field, filter_values, extra_filters),
+        '$group': ', '.join(group_fields)
+    }
+
+
+def _discover_params(
+    extra_filters: Optional[Dict[str, str]] = None,
+    limit: int = PAGE_SIZE,
+    offset: int = 0
+) -> Dict:
+    """列出所有合約市場（依市場代碼分組取最新報告日期）單一分頁的 SoQL 參數"""
+    group_fields = ['cftc_contract_market_code', 'market_and_exchange_names']
+    params = {
+        '$select': ', '.join(group_fields + ['max(report_date_as_yyyy_mm_dd) AS latest_report_date']),
+        '$group': ', '.join(group_fields),
+        # 依分組欄位排序，確保分頁結果穩定不重疊
+        '$order': ', '.join(group_fields),
+        '$limit': limit,
+        '$offset': offset
+    }
+    if extra_filters:
+        params['$where'] = ' AND '.join(
+            f"{field} = '{value}'" for field, value in extra_filters.items()
+        )
+    return params
+
+
+def _normalize_probe_rows(rows: List[Dict]) -> List[Dict]:
+    """將探測結果中的 latest_report_date 轉為 YYYY-MM-DD"""
+    for row in rows:
+        if row.get('latest_report_date'):
+            row['latest_report_date'] = _normalize_date(row['latest_report_date'])
+    return rows
+
+
+def _normalize_date(date_str: str) -> str:
+    """將 API 回傳的日期（例如 2026-08-18T00:00:00.000）轉換為 YYYY-MM-DD 格式"""
+    try:
+        dt = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+        return dt.strftime('%Y-%m-%d')
+    except (ValueError, AttributeError):
+        return date_str.split('T')[0] if 'T' in date_str else date_str
+
+
+def _soql_list(values: List[str]) -> str:
+    """將值列表轉為 SoQL `IN (...)` 使用的字串（單引號跳脫）"""
+    return ', '.join("'" + str(v).replace("'", "''") + "'" for v in values)
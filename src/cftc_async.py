@@ -0,0 +1,340 @@
+"""
+CFTC API 非同步客戶端
+介面與 CFTCAPIClient 相同（方法改為 coroutine），
+用於同時監控大量合約時並行發送請求
+"""
+
+import asyncio
+import time
+from typing import Dict, List, Optional
+import logging
+
+import aiohttp
+import pandas as pd
+
+from config import (
+    APP_TOKEN, REQUEST_TIMEOUT, MAX_RETRIES, PAGE_SIZE,
+    ASYNC_CONCURRENCY, RATE_LIMIT_WITH_TOKEN, RATE_LIMIT_WITHOUT_TOKEN, RATE_LIMIT_BURST
+)
+from cftc_api import (
+    CFTCAPIClient, backoff_delay, STREAM_CHUNK_SIZE,
+    _data_params, _in_where_clause, _page_params, _probe_params, _discover_params,
+    _normalize_probe_rows, _normalize_date
+)
+from json_stream import JSONArrayStream, TypedColumns
+
+logger = logging.getLogger(__name__)
+
+# 需要重試的 HTTP 狀態碼（限流與暫時性的伺服器錯誤）
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Token bucket 速率限制器
+    
+    每秒補充 rate 個 token，最多累積 capacity 個；每次請求消耗一個，
+    沒有 token 時等待到下一個 token 產生為止。
+    """
+    
+    def __init__(self, rate: float, capacity: int):
+        """
+        Args:
+            rate: 每秒補充的 token 數（即長期平均的每秒請求數）
+            capacity: bucket 容量（允許的瞬間突發請求數）
+        """
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self):
+        """取得一個 token，必要時等待"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncCFTCAPIClient:
+    """CFTC API 非同步客戶端類"""
+    
+    build_select = staticmethod(CFTCAPIClient.build_select)
+    
+    def __init__(
+        self,
+        app_token: Optional[str] = None,
+        concurrency: int = ASYNC_CONCURRENCY,
+        rate: Optional[float] = None
+    ):
+        """
+        初始化非同步 API 客戶端
+        
+        Args:
+            app_token: CFTC App Token (可選)
+            concurrency: 同時進行中的請求上限
+            rate: 每秒請求數上限；為 None 時依是否有 App Token 自動選擇
+        """
+        self.app_token = app_token or APP_TOKEN
+        if rate is None:
+            rate = RATE_LIMIT_WITH_TOKEN if self.app_token else RATE_LIMIT_WITHOUT_TOKEN
+        self.limiter = TokenBucket(rate, RATE_LIMIT_BURST)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self._session: Optional[aiohttp.ClientSession] = None
+    
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """延遲建立 session（必須在 event loop 內建立）"""
+        if self._session is None:
+            headers = {'X-App-Token': self.app_token} if self.app_token else {}
+            self._session = aiohttp.ClientSession(
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+            )
+        return self._session
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+    
+    async def fetch_data(
+        self,
+        api_endpoint: str,
+        filter_field: str,
+        filter_value: str,
+        start_date: Optional[str] = None,
+        limit: int = PAGE_SIZE,
+        extra_filters: Optional[Dict[str, str]] = None,
+        select_fields: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """
+        從 CFTC API 獲取數據，參數同 CFTCAPIClient.fetch_data
+        
+        Returns:
+            包含 COT 數據的字典列表
+        """
+        params = _data_params(filter_field, filter_value, start_date, limit, extra_filters, select_fields)
+        
+        logger.info(f"正在獲取數據: {filter_value}")
+        data = await self._get(api_endpoint, params, label=filter_value)
+        
+        if not data:
+            logger.warning(f"未找到 {filter_value} 的數據")
+            return []
+        
+        logger.info(f"成功獲取 {len(data)} 筆 {filter_value} 數據")
+        return data
+    
+    async def fetch_batch(
+        self,
+        api_endpoint: str,
+        filter_field: str,
+        filter_values: List[str],
+        start_date: Optional[str] = None,
+        limit: int = PAGE_SIZE,
+        extra_filters: Optional[Dict[str, List[str]]] = None,
+        select_fields: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """
+        以單一 `IN (...)` 查詢獲取多個商品的數據，參數同 CFTCAPIClient.fetch_batch
+        
+        Returns:
+            包含所有篩選值之 COT 數據的字典列表
+        """
+        where_clause = _in_where_clause(filter_field, filter_values, extra_filters, start_date)
+        label = ', '.join(filter_values)
+        logger.info(f"正在批次獲取數據: {label}")
+        
+        rows = await self.fetch_pages(api_endpoint, where_clause, limit, select_fields, label=label)
+        
+        logger.info(f"成功批次獲取 {len(rows)} 筆數據 ({label})")
+        return rows
+    
+    async def fetch_pages(
+        self,
+        api_endpoint: str,
+        where_clause: str,
+        limit: int = PAGE_SIZE,
+        select_fields: Optional[List[str]] = None,
+        label: str = ''
+    ) -> List[Dict]:
+        """
+        依任意 WHERE 子句以 $offset 分頁取回所有資料列，參數同 CFTCAPIClient.fetch_pages
+        
+        Returns:
+            所有分頁的字典列表
+        """
+        rows: List[Dict] = []
+        offset = 0
+        while True:
+            params = _page_params(where_clause, limit, offset, select_fields)
+            page = await self._get(api_endpoint, params, label=label or api_endpoint)
+            rows.extend(page)
+            if len(page) < limit:
+                break
+            offset += limit
+        return rows
+    
+    async def fetch_columns(
+        self,
+        api_endpoint: str,
+        where_clause: str,
+        fields: Dict[str, str],
+        limit: int = PAGE_SIZE,
+        label: str = ''
+    ) -> pd.DataFrame:
+        """
+        分頁取回資料並串流解碼成型別化欄位，參數同 CFTCAPIClient.fetch_columns
+        
+        Returns:
+            以 API 欄位名稱為欄的 DataFrame
+        """
+        columns = TypedColumns(fields, capacity=limit)
+        offset = 0
+        while True:
+            params = _page_params(where_clause, limit, offset, list(fields))
+            count = await self._get(api_endpoint, params, label=label or api_endpoint, columns=columns)
+            if count < limit:
+                break
+            offset += limit
+        return columns.to_frame()
+    
+    async def get_latest_report_date(
+        self,
+        api_endpoint: str,
+        filter_field: str,
+        filter_value: str
+    ) -> Optional[str]:
+        """
+        獲取最新報告日期
+        
+        Returns:
+            最新報告日期 (YYYY-MM-DD) 或 None
+        """
+        data = await self.fetch_data(
+            api_endpoint=api_endpoint,
+            filter_field=filter_field,
+            filter_value=filter_value,
+            limit=1
+        )
+        if data and data[0].get('report_date_as_yyyy_mm_dd'):
+            return _normalize_date(data[0]['report_date_as_yyyy_mm_dd'])
+        return None
+    
+    async def get_latest_report_dates(
+        self,
+        api_endpoint: str,
+        filter_field: str,
+        filter_values: List[str],
+        extra_filters: Optional[Dict[str, List[str]]] = None
+    ) -> List[Dict]:
+        """
+        以單一聚合查詢取得各篩選值的最新報告日期，參數同 CFTCAPIClient.get_latest_report_dates
+        
+        Returns:
+            字典列表，每筆包含分組欄位與 'latest_report_date' (YYYY-MM-DD)
+        """
+        params = _probe_params(filter_field, filter_values, extra_filters)
+        label = ', '.join(filter_values)
+        logger.info(f"正在探測最新報告日期: {label}")
+        rows = await self._get(api_endpoint, params, label=label)
+        return _normalize_probe_rows(rows)
+    
+    async def discover_markets(
+        self,
+        api_endpoint: str,
+        extra_filters: Optional[Dict[str, str]] = None
+    ) -> List[Dict]:
+        """
+        列出端點上所有合約市場及各自的最新報告日期，參數同 CFTCAPIClient.discover_markets
+        
+        Returns:
+            字典列表，每筆包含 cftc_contract_market_code、market_and_exchange_names
+            與 'latest_report_date' (YYYY-MM-DD)
+        """
+        logger.info(f"正在列出所有合約市場: {api_endpoint}")
+        rows: List[Dict] = []
+        offset = 0
+        while True:
+            page = await self._get(api_endpoint, _discover_params(extra_filters, PAGE_SIZE, offset), label=api_endpoint)
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                break
+            offset += PAGE_SIZE
+        return _normalize_probe_rows(rows)
+    
+    async def _get(
+        self,
+        api_endpoint: str,
+        params: Dict,
+        label: str,
+        columns: Optional[TypedColumns] = None
+    ):
+        """
+        在並行上限與速率限制下發送 GET 請求，
+        遇到 429/5xx 或連線錯誤時以指數退避加隨機抖動重試
+        
+        Args:
+            api_endpoint: API 端點 URL
+            params: SoQL 查詢參數
+            label: 日誌中用來辨識此請求的名稱
+            columns: 指定時以串流方式把回應解碼進這個欄位容器
+        
+        Returns:
+            API 回傳的字典列表；指定 columns 時回傳本次加入的筆數
+        """
+        if self.app_token:
+            params['$$app_token'] = self.app_token
+        query = {key: str(value) for key, value in params.items()}
+        start = columns.length if columns is not None else 0
+        
+        for attempt in range(MAX_RETRIES):
+            retry_after = None
+            try:
+                await self.limiter.acquire()
+                async with self.semaphore:
+                    async with self.session.get(api_endpoint, params=query) as response:
+                        if response.status in RETRY_STATUSES:
+                            retry_after = response.headers.get('Retry-After')
+                            raise aiohttp.ClientResponseError(
+                                response.request_info, response.history,
+                                status=response.status, message=response.reason or ''
+                            )
+                        response.raise_for_status()
+                        if columns is None:
+                            return await response.json(content_type=None)
+                        
+                        # 重試時丟掉上一次不完整的分頁
+                        columns.truncate(start)
+                        stream = JSONArrayStream()
+                        async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                            columns.feed(stream, chunk)
+                        stream.close()
+                        return columns.length - start
+            
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                retryable = not isinstance(e, aiohttp.ClientResponseError) or e.status in RETRY_STATUSES
+                logger.error(f"API 請求失敗 (嘗試 {attempt + 1}/{MAX_RETRIES}): {label} {e}")
+                if retryable and attempt < MAX_RETRIES - 1:
+                    delay = backoff_delay(attempt, retry_after)
+                    logger.info(f"等待 {delay:.1f} 秒後重試...")
+                    await asyncio.sleep(delay)
+                else:
+                    logger.error(f"放棄獲取 {label} 數據")
+                    raise
+        
+        return []
+    
+    async def close(self):
+        """關閉 session"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -57,17 +57,65 @@ COMMODITIES = {
         "filter_value": "E-MINI S&P 500",
         "long_field": "asset_mgr_positions_long",
         "short_field": "asset_mgr_positions_short",
+        # 從本地 TFF 全市場鏡像導出（與 cot_scoring、cboe_pcr_scraper 共用），不另外查詢 API
+        "mirror": {"dataset": "tff", "market": "13874A"},
         "output_file": BASE_DIR / "data" / "sp500_cot_data.csv",
         "description": "S&P 500 E-mini - Asset Manager 部位"
     }
 }
 
+# 各商品可另外指定 "extra_fields": [...]，會一併加入 $select 並保留在輸出的 CSV 中
+# 指定 "mirror": {"dataset": ..., "market": cftc_contract_market_code} 時改從全市場鏡像（UNIVERSE_DATASETS）導出，
+# long_field / short_field 必須在該數據集的 fields 中；鏡像無法更新時退回直接查詢 API
+
+# 數據儲存格式："csv"（預設）、"parquet" 或 "feather"（後兩者需安裝 pyarrow）
+# 欄式格式以原生型別儲存日期與整數，存於 output_file 同目錄、同檔名換副檔名，
+# 並同時匯出 output_file 的 CSV 供既有讀取端使用；各商品也可用 "storage_backend" 個別指定
+STORAGE_BACKEND = os.getenv("COT_STORAGE_BACKEND", "csv")
+
+# 全市場鏡像（universe mode）：每個端點以少數幾次分頁批量查詢取得所有合約市場，
+# 存成一份以 (market, report_date) 為索引的長格式檔案，單一市場的檔案再依需要從中導出
+# fields 為除了報告日期、未平倉量以外要保留的欄位（$select）
+UNIVERSE_DIR = BASE_DIR / "data" / "universe"
+UNIVERSE_HISTORY_DAYS = 1825  # 首次建立時抓取的歷史天數
+UNIVERSE_DATASETS = {
+    "disaggregated": {
+        "api_endpoint": DISAGGREGATED_API,
+        "extra_filters": {"futonly_or_combined": "FutOnly"},
+        "fields": [
+            "m_money_positions_long_all",
+            "m_money_positions_short_all",
+        ],
+    },
+    "tff": {
+        "api_endpoint": TFF_API,
+        "extra_filters": {},
+        "fields": [
+            "dealer_positions_long_all",
+            "dealer_positions_short_all",
+            "asset_mgr_positions_long",
+            "asset_mgr_positions_short",
+            "lev_money_positions_long",
+            "lev_money_positions_short",
+        ],
+    },
+}
+
 # API 請求配置
 REQUEST_TIMEOUT = 30  # 秒
 MAX_RETRIES = 3
-RETRY_DELAY = 5  # 秒
+RETRY_DELAY = 5  # 秒，指數退避的基準等待時間
+RETRY_MAX_DELAY = 60  # 秒，單次重試等待上限
 PAGE_SIZE = 5000  # 每次請求的最大記錄數
 
+# 非同步客戶端配置
+# Socrata 對沒有 App Token 的請求以來源 IP 共用配額限流，容易觸發 429；
+# 帶 App Token 時配額高得多，因此兩者使用不同的速率
+ASYNC_CONCURRENCY = int(os.getenv("CFTC_ASYNC_CONCURRENCY", "8"))  # 同時進行中的請求上限
+RATE_LIMIT_WITH_TOKEN = float(os.getenv("CFTC_RATE_LIMIT_WITH_TOKEN", "5"))  # 每秒請求數
+RATE_LIMIT_WITHOUT_TOKEN = float(os.getenv("CFTC_RATE_LIMIT_WITHOUT_TOKEN", "1"))  # 每秒請求數
+RATE_LIMIT_BURST = int(os.getenv("CFTC_RATE_LIMIT_BURST", "5"))  # token bucket 容量
+
 # 數據欄位映射
 COMMON_FIELDS = {
     "report_date_as_yyyy_mm_dd": "report_date",
@@ -3,13 +3,16 @@
 用於處理和儲存 COT 數據
 """
 
+import io
+import shutil
 import pandas as pd
 from pathlib import Path
 from typing import Dict, List, Optional
 from datetime import datetime
 import logging
 
-from config import COMMON_FIELDS
+from config import COMMON_FIELDS, STORAGE_BACKEND
+from storage import atomic_writer, create_storage
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +31,10 @@ class COTDataProcessor:
         self.output_file = Path(commodity_config['output_file'])
         self.long_field = commodity_config['long_field']
         self.short_field = commodity_config['short_field']
+        self.extra_fields = list(commodity_config.get('extra_fields', []))
+        self.storage = create_storage(
+            self.output_file, commodity_config.get('storage_backend', STORAGE_BACKEND)
+        )
     
     def process_data(self, raw_data: List[Dict]) -> pd.DataFrame:
         """
@@ -53,6 +60,8 @@ class COTDataProcessor:
             self.long_field: 'long_positions',
             self.short_field: 'short_positions'
         }
+        for extra_field in self.extra_fields:
+            required_fields.setdefault(extra_field, extra_field)
         
         # 檢查欄位是否存在
         missing_fields = [f for f in required_fields.keys() if f not in df.columns]
@@ -75,6 +84,16 @@ class COTDataProcessor:
         # 計算淨部位
         df['net_positions'] = df['long_positions'] - df['short_positions']
         
+        # 額外欄位放在基本欄位之後，能轉成數值的就轉換
+        if self.extra_fields:
+            base_columns = ['report_date', 'open_interest', 'long_positions', 'short_positions', 'net_positions']
+            extra_columns = [c for c in df.columns if c not in base_columns]
+            for col in extra_columns:
+                converted = pd.to_numeric(df[col], errors='coerce')
+                if converted.notna().sum() == df[col].notna().sum():
+                    df[col] = converted
+            df = df[base_columns + extra_columns]
+        
         # 按日期排序（最新在前）
         df.sort_values('report_date', ascending=False, inplace=True)
         
@@ -87,14 +106,14 @@ class COTDataProcessor:
     
     def load_existing_data(self) -> pd.DataFrame:
         """
-        載入現有的 CSV 數據
+        載入現有數據
         
         Returns:
             現有數據的 DataFrame，如果文件不存在則返回空 DataFrame
         """
-        if self.output_file.exists():
+        if self.storage.exists():
             try:
-                df = pd.read_csv(self.output_file)
+                df = self.storage.load()
                 logger.info(f"載入現有數據: {len(df)} 筆記錄")
                 return df
             except Exception as e:
@@ -136,7 +155,7 @@ class COTDataProcessor:
     
     def save_data(self, df: pd.DataFrame) -> bool:
         """
-        儲存數據到 CSV 文件
+        儲存數據（CSV，或欄式格式並同時匯出 CSV）
         
         Args:
             df: 要儲存的 DataFrame
@@ -148,10 +167,10 @@ class COTDataProcessor:
             # 確保輸出目錄存在
             self.output_file.parent.mkdir(parents=True, exist_ok=True)
             
-            # 儲存為 CSV
-            df.to_csv(self.output_file, index=False)
+            # 先寫暫存檔再替換，避免中途失敗留下不完整的檔案
+            self.storage.save(df)
             
-            logger.info(f"數據已儲存至: {self.output_file}")
+            logger.info(f"數據已儲存至: {self.storage.path}")
             return True
             
         except Exception as e:
@@ -165,12 +184,15 @@ class COTDataProcessor:
         Returns:
             最新日期 (YYYY-MM-DD) 或 None
         """
-        existing_data = self.load_existing_data()
-        
-        if existing_data.empty:
+        if not self.storage.exists():
             return None
         
-        return existing_data['report_date'].max()
+        # 只讀取 report_date，不需要讀入整個檔案
+        try:
+            return self.storage.latest_date()
+        except Exception as e:
+            logger.error(f"讀取最新日期失敗: {e}")
+            return None
     
     def update(self, new_data: List[Dict]) -> bool:
         """
@@ -190,6 +212,15 @@ class COTDataProcessor:
                 logger.warning("沒有新數據需要更新")
                 return False
             
+            # CSV 後端優先走增量路徑，只有檔案結構不符時才整檔合併重寫；
+            # 欄式後端載入本身不需解析，直接整檔合併
+            if (
+                self.storage.format == 'csv'
+                and self.output_file.exists()
+                and self.update_incremental(processed_new)
+            ):
+                return True
+            
             # 載入現有數據
             existing = self.load_existing_data()
             
@@ -202,3 +233,58 @@ class COTDataProcessor:
         except Exception as e:
             logger.error(f"更新數據時發生錯誤: {e}")
             return False
+    
+    def update_incremental(self, processed_new: pd.DataFrame) -> bool:
+        """
+        增量更新：只解析與新數據重疊的最新幾筆記錄
+        
+        CSV 依日期由新到舊排序，因此「最新的尾端」位於檔案開頭。做法是逐行掃描
+        開頭、直到日期早於新數據最早日期為止，只把這段重疊區間讀進記憶體與新數據
+        合併；其餘較舊的記錄以原始位元組直接複製到暫存檔，再原子替換原檔。
+        解析、去重與排序的成本只與新數據筆數相關，與歷史長度無關。
+        
+        Args:
+            processed_new: process_data 處理後的新數據
+            
+        Returns:
+            是否以增量方式完成更新；檔案結構不符（例如欄位不同）時回傳 False，
+            由呼叫端改走整檔合併
+        """
+        oldest_new = processed_new['report_date'].min()
+        
+        with open(self.output_file, 'rb') as src:
+            header = src.readline()
+            columns = header.decode('utf-8').strip().split(',')
+            if columns[0] != 'report_date' or set(processed_new.columns) - set(columns):
+                logger.info("現有檔案欄位與新數據不同，改為整檔合併")
+                return False
+            
+            overlap_lines = []
+            while True:
+                offset = src.tell()
+                line = src.readline()
+                if not line:
+                    break
+                if line.split(b',', 1)[0].decode('utf-8') < oldest_new:
+                    src.seek(offset)
+                    break
+                overlap_lines.append(line)
+            
+            if overlap_lines:
+                overlap = pd.read_csv(io.BytesIO(header + b''.join(overlap_lines)))
+            else:
+                overlap = pd.DataFrame(columns=columns)
+            merged_head = self.merge_data(processed_new, overlap).reindex(columns=columns)
+            
+            with atomic_writer(self.output_file) as dst:
+                dst.write(header.decode('utf-8'))
+                merged_head.to_csv(dst, index=False, header=False)
+                dst.flush()
+                # 較舊的記錄不解析，直接以位元組複製
+                shutil.copyfileobj(src, dst.buffer)
+        
+        logger.info(
+            f"增量更新完成: 重疊 {len(overlap_lines)} 筆、新數據 {len(processed_new)} 筆，"
+            f"數據已儲存至: {self.output_file}"
+        )
+        return True
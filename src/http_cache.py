@@ -0,0 +1,219 @@
+"""
+HTTP 條件式請求磁碟快取
+回應內容以 gzip 壓縮存在磁碟，並記錄 ETag / Last-Modified；
+下次請求帶上 If-None-Match / If-Modified-Since，304 時直接使用快取內容。
+來源沒有提供驗證標頭時，改以呼叫端指定的 TTL 判斷快取是否仍可使用。
+
+cached_get 以 requests 發送請求，回傳 requests.Response，呼叫端可照常使用
+.content / .text / .json() / raise_for_status()；
+cached_urlopen 只使用標準函式庫（供 TIC_Dealer_monitor.py 這類不安裝 requests 的腳本）。
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(os.getenv("HTTP_CACHE_DIR", Path(__file__).resolve().parent.parent / ".http_cache"))
+
+# 一併保存的回應標頭（決定 .text 的編碼、.json() 的判斷）
+KEPT_HEADERS = ("Content-Type", "Content-Encoding", "ETag", "Last-Modified")
+
+
+class HTTPCache:
+    """以 URL 為鍵的磁碟快取：<sha256>.gz 為內容，<sha256>.json 為驗證標頭與抓取時間"""
+    
+    def __init__(self, cache_dir: Path = CACHE_DIR):
+        """
+        Args:
+            cache_dir: 快取目錄
+        """
+        self.cache_dir = Path(cache_dir)
+    
+    def _paths(self, url: str):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{key}.json", self.cache_dir / f"{key}.gz"
+    
+    def lookup(self, url: str) -> Optional[Dict]:
+        """
+        讀取快取的中繼資料
+        
+        Returns:
+            {'url', 'headers', 'fetched_at'}；沒有快取或內容檔遺失時為 None
+        """
+        meta_path, body_path = self._paths(url)
+        if not meta_path.exists() or not body_path.exists():
+            return None
+        try:
+            return json.loads(meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+    
+    def body(self, url: str) -> bytes:
+        """讀取快取內容（解壓縮後）"""
+        _, body_path = self._paths(url)
+        with gzip.open(body_path, "rb") as f:
+            return f.read()
+    
+    @staticmethod
+    def validators(entry: Optional[Dict]) -> Dict[str, str]:
+        """由快取的驗證標頭產生條件式請求標頭"""
+        if not entry:
+            return {}
+        headers = {}
+        if entry["headers"].get("ETag"):
+            headers["If-None-Match"] = entry["headers"]["ETag"]
+        if entry["headers"].get("Last-Modified"):
+            headers["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+        return headers
+    
+    @staticmethod
+    def is_fresh(entry: Optional[Dict], ttl: Optional[float]) -> bool:
+        """沒有驗證標頭的快取是否仍在 TTL 內（有驗證標頭的一律送條件式請求）"""
+        if not entry or ttl is None or HTTPCache.validators(entry):
+            return False
+        return time.time() - entry["fetched_at"] < ttl
+    
+    def store(self, url: str, headers, body: bytes, ttl: Optional[float]):
+        """
+        寫入快取；沒有驗證標頭也沒有 TTL 的回應不快取（下次仍須完整下載，存了也用不到）
+        
+        Args:
+            url: 完整 URL（含查詢參數）
+            headers: 回應標頭（不分大小寫的 mapping）
+            body: 回應內容
+            ttl: 來源的 TTL（秒）
+        """
+        kept = {name: headers.get(name) for name in KEPT_HEADERS if headers.get(name)}
+        # requests 已解開 Content-Encoding，存的是解壓後的內容
+        kept.pop("Content-Encoding", None)
+        if ttl is None and not ("ETag" in kept or "Last-Modified" in kept):
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        meta_path, body_path = self._paths(url)
+        tmp_body = body_path.with_name(body_path.name + ".tmp")
+        with gzip.open(tmp_body, "wb") as f:
+            f.write(body)
+        os.replace(tmp_body, body_path)
+        self._write_meta(meta_path, {"url": url, "headers": kept, "fetched_at": time.time()})
+    
+    def touch(self, url: str, entry: Dict):
+        """304 時更新抓取時間"""
+        meta_path, _ = self._paths(url)
+        self._write_meta(meta_path, {**entry, "fetched_at": time.time()})
+    
+    @staticmethod
+    def _write_meta(path: Path, entry: Dict):
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(entry, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+
+
+def _cached_response(url: str, entry: Dict, body: bytes):
+    import requests
+    
+    response = requests.Response()
+    response.status_code = 200
+    response.url = url
+    response.headers.update(entry["headers"])
+    response._content = body
+    response.from_cache = True
+    return response
+
+
+def cached_get(
+    url: str,
+    params: Optional[Dict] = None,
+    headers: Optional[Dict] = None,
+    ttl: Optional[float] = None,
+    session=None,
+    cache: Optional[HTTPCache] = None,
+    **kwargs
+):
+    """
+    帶快取的 GET
+    
+    Args:
+        url: 網址
+        params: 查詢參數
+        headers: 請求標頭
+        ttl: 來源沒有 ETag / Last-Modified 時快取的有效秒數；None 表示不以 TTL 快取
+        session: requests.Session（預設直接用 requests）
+        cache: HTTPCache（預設 CACHE_DIR）
+        **kwargs: 傳給 requests 的其他參數（timeout 等）
+    
+    Returns:
+        requests.Response；from_cache 屬性表示內容是否來自快取。
+        非 200/304 的回應原樣回傳，由呼叫端 raise_for_status()
+    """
+    import requests
+    
+    cache = cache or HTTPCache()
+    full_url = requests.Request("GET", url, params=params).prepare().url
+    entry = cache.lookup(full_url)
+    
+    if HTTPCache.is_fresh(entry, ttl):
+        logger.info(f"使用快取（TTL 內）: {full_url}")
+        return _cached_response(full_url, entry, cache.body(full_url))
+    
+    request_headers = {**(headers or {}), **HTTPCache.validators(entry)}
+    response = (session or requests).get(url, params=params, headers=request_headers, **kwargs)
+    
+    if response.status_code == 304 and entry:
+        logger.info(f"內容未變更 (304)，使用快取: {full_url}")
+        cache.touch(full_url, entry)
+        return _cached_response(full_url, entry, cache.body(full_url))
+    
+    response.from_cache = False
+    if response.status_code == 200:
+        cache.store(full_url, response.headers, response.content, ttl)
+    return response
+
+
+def cached_urlopen(
+    url: str,
+    params: Optional[Dict] = None,
+    headers: Optional[Dict] = None,
+    ttl: Optional[float] = None,
+    timeout: float = 30,
+    cache: Optional[HTTPCache] = None
+) -> bytes:
+    """
+    只使用標準函式庫的帶快取 GET
+    
+    Returns:
+        回應內容
+    
+    Raises:
+        urllib.error.URLError / HTTPError: 與 urlopen 相同（304 除外）
+    """
+    cache = cache or HTTPCache()
+    full_url = f"{url}?{urlencode(params)}" if params else url
+    entry = cache.lookup(full_url)
+    
+    if HTTPCache.is_fresh(entry, ttl):
+        return cache.body(full_url)
+    
+    req = Request(full_url, headers={**(headers or {}), **HTTPCache.validators(entry)})
+    try:
+        with urlopen(req, timeout=timeout) as r:
+            body = r.read()
+            response_headers = r.headers
+    except HTTPError as e:
+        if e.code == 304 and entry:
+            cache.touch(full_url, entry)
+            return cache.body(full_url)
+        raise
+    
+    # urlopen 不會解開 Content-Encoding；沒有要求壓縮時伺服器也不會壓縮
+    cache.store(full_url, response_headers, body, ttl)
+    return body
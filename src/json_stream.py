@@ -0,0 +1,198 @@
+"""
+串流 JSON 解碼
+逐塊解析 API 回傳的 JSON 陣列，只保留指定欄位，直接寫入預先配置的 NumPy 欄位陣列，
+不需要先把整份回應轉成 dict 列表，記憶體用量只與保留的欄位成正比
+"""
+
+import codecs
+import json
+import sys
+from typing import Dict, Iterable, Iterator
+
+import numpy as np
+import pandas as pd
+
+# 欄位型別 -> NumPy dtype
+KIND_DTYPES = {
+    'date': 'datetime64[D]',
+    'float': 'float64',
+    'str': object,
+}
+
+_WHITESPACE = ' \t\n\r'
+
+
+class JSONArrayStream:
+    """
+    頂層 JSON 陣列的增量解析器：每次餵入一塊位元組，回傳這塊資料中已完整的物件
+    
+    同步（requests 的 iter_content）與非同步（aiohttp 的 iter_chunked）來源共用。
+    """
+    
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._started = False
+        self.finished = False
+    
+    def feed(self, chunk: bytes) -> Iterator[dict]:
+        """
+        餵入一塊資料
+        
+        Yields:
+            這塊資料中已完整的陣列元素
+        
+        Raises:
+            ValueError: 內容不是 JSON 陣列（例如 API 回傳錯誤物件）
+        """
+        buffer = self._buffer + self._utf8.decode(chunk)
+        pos = 0
+        try:
+            while True:
+                while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                    pos += 1
+                if pos >= len(buffer):
+                    break
+                if not self._started:
+                    if buffer[pos] != '[':
+                        raise ValueError(f"回應不是 JSON 陣列: {buffer[pos:pos + 200]}")
+                    self._started = True
+                    pos += 1
+                    continue
+                if self.finished:
+                    raise ValueError("JSON 陣列結束後仍有多餘內容")
+                if buffer[pos] == ',':
+                    pos += 1
+                    continue
+                if buffer[pos] == ']':
+                    self.finished = True
+                    pos += 1
+                    continue
+                try:
+                    obj, end = self._decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    # 物件跨越區塊邊界，等下一塊資料
+                    break
+                pos = end
+                yield obj
+        finally:
+            self._buffer = buffer[pos:]
+    
+    def close(self):
+        """
+        結束解析
+        
+        Raises:
+            ValueError: 陣列不完整
+        """
+        if not self.finished:
+            raise ValueError("JSON 陣列不完整")
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[dict]:
+    """
+    逐一產生頂層 JSON 陣列中的物件，邊讀邊解析
+    
+    Args:
+        chunks: 回應內容的位元組區塊（例如 response.iter_content()）
+    
+    Yields:
+        陣列中的每個物件
+    """
+    stream = JSONArrayStream()
+    for chunk in chunks:
+        yield from stream.feed(chunk)
+    stream.close()
+
+
+class TypedColumns:
+    """
+    預先配置的型別化欄位容器
+    
+    每個欄位是一個 NumPy 陣列，容量不足時倍增；字串欄位會 intern，
+    重複的市場代碼/名稱只佔一份記憶體。
+    """
+    
+    def __init__(self, fields: Dict[str, str], capacity: int = 1024):
+        """
+        Args:
+            fields: {API 欄位名稱: 型別}，型別為 'date'、'float' 或 'str'
+            capacity: 初始容量（筆數）
+        """
+        unknown = set(fields.values()) - set(KIND_DTYPES)
+        if unknown:
+            raise ValueError(f"不支援的欄位型別: {unknown}")
+        self.fields = dict(fields)
+        self.length = 0
+        self.arrays = {
+            name: self._empty(kind, max(1, capacity)) for name, kind in self.fields.items()
+        }
+    
+    @staticmethod
+    def _empty(kind: str, size: int) -> np.ndarray:
+        if kind == 'float':
+            return np.full(size, np.nan)
+        if kind == 'date':
+            return np.full(size, np.datetime64('NaT'), dtype=KIND_DTYPES['date'])
+        return np.full(size, None, dtype=object)
+    
+    def reserve(self, size: int):
+        """確保至少可容納 size 筆"""
+        capacity = len(next(iter(self.arrays.values())))
+        if size <= capacity:
+            return
+        new_capacity = max(size, capacity * 2)
+        for name, kind in self.fields.items():
+            grown = self._empty(kind, new_capacity)
+            grown[:self.length] = self.arrays[name][:self.length]
+            self.arrays[name] = grown
+    
+    def truncate(self, length: int):
+        """捨棄 length 之後的資料（重試時丟掉不完整的分頁）"""
+        for name, kind in self.fields.items():
+            self.arrays[name][length:self.length] = self._empty(kind, 1)[0]
+        self.length = length
+    
+    def append(self, row: dict):
+        """加入一筆資料，只取 fields 中的欄位"""
+        if self.length >= len(next(iter(self.arrays.values()))):
+            self.reserve(self.length + 1)
+        i = self.length
+        for name, kind in self.fields.items():
+            value = row.get(name)
+            if value is None:
+                continue
+            if kind == 'float':
+                try:
+                    self.arrays[name][i] = float(value)
+                except (TypeError, ValueError):
+                    pass
+            elif kind == 'date':
+                self.arrays[name][i] = np.datetime64(str(value)[:10], 'D')
+            else:
+                self.arrays[name][i] = sys.intern(str(value))
+        self.length += 1
+    
+    def feed(self, stream: JSONArrayStream, chunk: bytes):
+        """將一塊資料中已完整的物件加入（非同步來源逐塊呼叫）"""
+        for row in stream.feed(chunk):
+            self.append(row)
+    
+    def extend_from_json(self, chunks: Iterable[bytes]) -> int:
+        """
+        從 JSON 陣列串流逐筆加入
+        
+        Returns:
+            本次加入的筆數
+        """
+        start = self.length
+        for row in iter_json_array(chunks):
+            self.append(row)
+        return self.length - start
+    
+    def to_frame(self) -> pd.DataFrame:
+        """轉為 DataFrame（只含已填入的筆數）"""
+        return pd.DataFrame({
+            name: array[:self.length] for name, array in self.arrays.items()
+        })
@@ -4,12 +4,19 @@ COT 數據抓取器主程式
 """
 
 import sys
+import asyncio
+import argparse
 import logging
 from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 
-from config import COMMODITIES
+import pandas as pd
+
+from config import COMMODITIES, UNIVERSE_DATASETS
 from cftc_api import CFTCAPIClient
+from cftc_async import AsyncCFTCAPIClient
 from data_processor import COTDataProcessor
+from universe import run_universe, refresh_mirror, UniverseStore
 
 # 設置日誌
 logging.basicConfig(
@@ -19,6 +26,65 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def build_extra_filters(config: dict) -> Dict[str, str]:
+    """
+    取得商品配置中的額外篩選條件
+    
+    若 config 有指定 contract_market_name / futonly_or_combined
+    （用於消除同一 commodity_name 底下混雜多合約、多 report type 的問題，
+    例如黃金/白銀），一併帶入篩選條件
+    
+    Args:
+        config: 商品配置
+        
+    Returns:
+        額外篩選條件字典（可能為空）
+    """
+    extra_filters = {}
+    if config.get('contract_market_name'):
+        extra_filters['contract_market_name'] = config['contract_market_name']
+    if config.get('futonly_or_combined'):
+        extra_filters['futonly_or_combined'] = config['futonly_or_combined']
+    return extra_filters
+
+
+def commodity_conditions(config: dict) -> Dict[str, str]:
+    """
+    商品在 API 資料列上的完整篩選條件（主篩選欄位加上額外篩選條件）
+    
+    Args:
+        config: 商品配置
+        
+    Returns:
+        {欄位名稱: 值}
+    """
+    conditions = {config['filter_field']: config['filter_value']}
+    conditions.update(build_extra_filters(config))
+    return conditions
+
+
+def compute_start_date(latest_date: Optional[str]) -> str:
+    """
+    依現有數據決定抓取起始日期
+    
+    Args:
+        latest_date: 現有數據的最新日期 (YYYY-MM-DD)，無數據時為 None
+        
+    Returns:
+        起始日期 (YYYY-MM-DD)
+    """
+    if latest_date:
+        logger.info(f"現有數據最新日期: {latest_date}")
+        # 從最新日期的前一週開始抓取（確保不遺漏）
+        start_date_obj = datetime.strptime(latest_date, '%Y-%m-%d') - timedelta(days=7)
+    else:
+        logger.info("無現有數據，將抓取最近 5 年的數據")
+        # 抓取最近 5 年的數據
+        start_date_obj = datetime.now() - timedelta(days=1825)
+    
+    return start_date_obj.strftime('%Y-%m-%d')
+
+
 def fetch_and_update_commodity(commodity_name: str, config: dict, api_client: CFTCAPIClient) -> bool:
     """
     抓取並更新單一商品的 COT 數據
@@ -42,56 +108,425 @@ def fetch_and_update_commodity(commodity_name: str, config: dict, api_client: CF
         # 獲取現有數據的最新日期
         latest_date = processor.get_latest_date()
         
-        if latest_date:
-            logger.info(f"現有數據最新日期: {latest_date}")
-            # 從最新日期的前一週開始抓取（確保不遺漏）
-            start_date_obj = datetime.strptime(latest_date, '%Y-%m-%d') - timedelta(days=7)
-            start_date = start_date_obj.strftime('%Y-%m-%d')
-        else:
-            logger.info("無現有數據，將抓取最近 5 年的數據")
-            # 抓取最近 5 年的數據
-            start_date_obj = datetime.now() - timedelta(days=1825)
-            start_date = start_date_obj.strftime('%Y-%m-%d')
+        # 先探測 API 上的最新報告日期，沒有新報告就不需要完整抓取
+        remote_dates = probe_latest_dates(
+            api_client, config['api_endpoint'], config['filter_field'], {commodity_name: config}
+        )
+        if is_up_to_date(latest_date, remote_dates.get(commodity_name)):
+            logger.info(f"{commodity_name} 已是最新 ({latest_date})，略過抓取")
+            return True
+        
+        start_date = compute_start_date(latest_date)
         
         # 從 API 獲取數據
-        # 若 config 有指定 contract_market_name / futonly_or_combined
-        # （用於消除同一 commodity_name 底下混雜多合約、多 report type 的問題，
-        # 例如黃金/白銀），一併帶入篩選條件
-        extra_filters = {}
-        if config.get('contract_market_name'):
-            extra_filters['contract_market_name'] = config['contract_market_name']
-        if config.get('futonly_or_combined'):
-            extra_filters['futonly_or_combined'] = config['futonly_or_combined']
+        extra_filters = build_extra_filters(config)
 
         raw_data = api_client.fetch_data(
             api_endpoint=config['api_endpoint'],
             filter_field=config['filter_field'],
             filter_value=config['filter_value'],
             start_date=start_date,
-            extra_filters=extra_filters if extra_filters else None
+            extra_filters=extra_filters if extra_filters else None,
+            select_fields=api_client.build_select([config])
         )
         
-        if not raw_data:
-            logger.warning(f"{commodity_name} 沒有新數據")
-            return False
+        return _update_commodity(commodity_name, processor, raw_data)
         
-        # 更新數據
-        success = processor.update(raw_data)
+    except Exception as e:
+        logger.error(f"處理 {commodity_name} 時發生錯誤: {e}", exc_info=True)
+        return False
+
+
+def group_commodities_by_endpoint(commodities: Dict[str, dict]) -> Dict[Tuple[str, str], Dict[str, dict]]:
+    """
+    依 (api_endpoint, filter_field) 將商品分組，同一組可用單一查詢取得
+    
+    Args:
+        commodities: 商品配置字典
         
-        if success:
-            logger.info(f"✓ {commodity_name} 數據更新成功")
-        else:
-            logger.error(f"✗ {commodity_name} 數據更新失敗")
+    Returns:
+        {(api_endpoint, filter_field): {商品名稱: 商品配置}}
+    """
+    groups: Dict[Tuple[str, str], Dict[str, dict]] = {}
+    for commodity_name, config in commodities.items():
+        key = (config['api_endpoint'], config['filter_field'])
+        groups.setdefault(key, {})[commodity_name] = config
+    return groups
+
+
+def split_rows_by_commodity(
+    rows: List[dict],
+    group: Dict[str, dict],
+    start_dates: Dict[str, str]
+) -> Dict[str, List[dict]]:
+    """
+    將批次查詢的結果依各商品的篩選值與起始日期在本地切分
+    
+    Args:
+        rows: 批次查詢回傳的資料列
+        group: 同一組的商品配置
+        start_dates: 各商品的抓取起始日期 (YYYY-MM-DD)
         
-        return success
+    Returns:
+        {商品名稱: 該商品的資料列}
+    """
+    criteria = {name: commodity_conditions(config) for name, config in group.items()}
+    
+    sliced: Dict[str, List[dict]] = {name: [] for name in group}
+    for row in rows:
+        report_date = str(row.get('report_date_as_yyyy_mm_dd', ''))[:10]
+        for commodity_name, conditions in criteria.items():
+            if report_date < start_dates[commodity_name]:
+                continue
+            if all(row.get(field) == value for field, value in conditions.items()):
+                sliced[commodity_name].append(row)
+    return sliced
+
+
+def server_side_filters(group: Dict[str, dict]) -> Dict[str, List[str]]:
+    """
+    組內每個商品都有指定的額外篩選欄位，才能安全地送到伺服器端；
+    其餘條件在本地切分時套用
+    
+    Args:
+        group: 同一組的商品配置
+        
+    Returns:
+        {欄位名稱: 允許值列表}
+    """
+    per_commodity_filters = [build_extra_filters(config) for config in group.values()]
+    shared_fields = set.intersection(*(set(f) for f in per_commodity_filters))
+    return {
+        field: sorted({f[field] for f in per_commodity_filters})
+        for field in sorted(shared_fields)
+    }
+
+
+def probe_latest_dates(
+    api_client: CFTCAPIClient,
+    api_endpoint: str,
+    filter_field: str,
+    group: Dict[str, dict]
+) -> Dict[str, Optional[str]]:
+    """
+    以一次聚合查詢取得組內各商品在 API 上的最新報告日期
+    
+    探測失敗不影響後續流程，只是回傳空結果（視為需要完整抓取）。
+    
+    Args:
+        api_client: API 客戶端
+        api_endpoint: API 端點 URL
+        filter_field: 篩選欄位名稱
+        group: 同一組的商品配置
+        
+    Returns:
+        {商品名稱: 最新報告日期 (YYYY-MM-DD) 或 None}
+    """
+    try:
+        rows = api_client.get_latest_report_dates(
+            api_endpoint=api_endpoint,
+            filter_field=filter_field,
+            filter_values=sorted({config['filter_value'] for config in group.values()}),
+            extra_filters=server_side_filters(group) or None
+        )
+    except Exception as e:
+        logger.warning(f"探測最新報告日期失敗，改為完整抓取: {e}")
+        return {}
+    
+    return match_latest_dates(rows, group)
+
+
+def match_latest_dates(rows: List[dict], group: Dict[str, dict]) -> Dict[str, Optional[str]]:
+    """
+    將探測查詢的分組結果對應回組內各商品
+    
+    Args:
+        rows: get_latest_report_dates 回傳的資料列
+        group: 同一組的商品配置
+        
+    Returns:
+        {商品名稱: 最新報告日期 (YYYY-MM-DD) 或 None}
+    """
+    latest: Dict[str, Optional[str]] = {}
+    for commodity_name, config in group.items():
+        conditions = commodity_conditions(config)
+        dates = [
+            row['latest_report_date'] for row in rows
+            if row.get('latest_report_date')
+            and all(row.get(field) == value for field, value in conditions.items())
+        ]
+        latest[commodity_name] = max(dates) if dates else None
+    return latest
+
+
+def is_up_to_date(stored_date: Optional[str], remote_date: Optional[str]) -> bool:
+    """現有數據是否已涵蓋 API 上的最新報告（任一日期未知時視為否）"""
+    return bool(stored_date and remote_date and remote_date <= stored_date)
+
+
+def fetch_and_update_batch(commodities: Dict[str, dict], api_client: CFTCAPIClient) -> Dict[str, bool]:
+    """
+    批次模式：每個 API 端點只發送一次查詢，再把結果分派給各商品的處理器
+    
+    Args:
+        commodities: 商品配置字典
+        api_client: API 客戶端
+        
+    Returns:
+        {商品名稱: 是否成功更新}
+    """
+    results: Dict[str, bool] = {}
+    
+    for (api_endpoint, filter_field), group in group_commodities_by_endpoint(commodities).items():
+        logger.info(f"\n{'='*60}")
+        logger.info(f"批次處理: {', '.join(group)} ({api_endpoint})")
+        logger.info(f"{'='*60}")
+        
+        try:
+            processors = {name: COTDataProcessor(config) for name, config in group.items()}
+            latest_dates = {name: processor.get_latest_date() for name, processor in processors.items()}
+            
+            # 新鮮度探測：已是最新的商品不抓取、不合併、不寫檔
+            remote_dates = probe_latest_dates(api_client, api_endpoint, filter_field, group)
+            for commodity_name in list(group):
+                if is_up_to_date(latest_dates[commodity_name], remote_dates.get(commodity_name)):
+                    logger.info(f"{commodity_name} 已是最新 ({latest_dates[commodity_name]})，略過抓取")
+                    results[commodity_name] = True
+            group = {name: config for name, config in group.items() if name not in results}
+            if not group:
+                continue
+            
+            start_dates = {name: compute_start_date(latest_dates[name]) for name in group}
+            extra_filters = server_side_filters(group)
+            
+            rows = api_client.fetch_batch(
+                api_endpoint=api_endpoint,
+                filter_field=filter_field,
+                filter_values=sorted({config['filter_value'] for config in group.values()}),
+                start_date=min(start_dates.values()),
+                extra_filters=extra_filters if extra_filters else None,
+                select_fields=api_client.build_select(list(group.values()))
+            )
+        except Exception as e:
+            logger.error(f"批次獲取 {', '.join(group)} 時發生錯誤: {e}", exc_info=True)
+            results.update({name: False for name in group})
+            continue
+        
+        sliced = split_rows_by_commodity(rows, group, start_dates)
+        for commodity_name, config in group.items():
+            logger.info(f"開始處理: {commodity_name} - {config['description']}")
+            try:
+                results[commodity_name] = _update_commodity(
+                    commodity_name, processors[commodity_name], sliced[commodity_name]
+                )
+            except Exception as e:
+                logger.error(f"處理 {commodity_name} 時發生錯誤: {e}", exc_info=True)
+                results[commodity_name] = False
+    
+    return results
+
+
+async def fetch_and_update_async(
+    commodities: Dict[str, dict],
+    api_client: AsyncCFTCAPIClient,
+    batch: bool = True
+) -> Dict[str, bool]:
+    """
+    非同步模式：各組（批次模式下為各端點，否則為各商品）同時探測、抓取與更新，
+    並行數與請求速率由 api_client 的並行上限與 token bucket 控制
+    
+    Args:
+        commodities: 商品配置字典
+        api_client: 非同步 API 客戶端
+        batch: 是否依端點合併查詢
+        
+    Returns:
+        {商品名稱: 是否成功更新}
+    """
+    if batch:
+        groups = group_commodities_by_endpoint(commodities)
+    else:
+        groups = {
+            (config['api_endpoint'], config['filter_field'], name): {name: config}
+            for name, config in commodities.items()
+        }
+    
+    group_results = await asyncio.gather(*(
+        _fetch_and_update_group_async(key[0], key[1], group, api_client)
+        for key, group in groups.items()
+    ))
+    
+    results: Dict[str, bool] = {}
+    for group_result in group_results:
+        results.update(group_result)
+    # 依配置順序回傳
+    return {name: results[name] for name in commodities}
+
+
+async def _fetch_and_update_group_async(
+    api_endpoint: str,
+    filter_field: str,
+    group: Dict[str, dict],
+    api_client: AsyncCFTCAPIClient
+) -> Dict[str, bool]:
+    """非同步處理同一端點的一組商品：探測、批次抓取、切分並更新"""
+    results: Dict[str, bool] = {}
+    
+    try:
+        processors = {name: COTDataProcessor(config) for name, config in group.items()}
+        latest_dates = {name: processor.get_latest_date() for name, processor in processors.items()}
+        
+        try:
+            probe_rows = await api_client.get_latest_report_dates(
+                api_endpoint=api_endpoint,
+                filter_field=filter_field,
+                filter_values=sorted({config['filter_value'] for config in group.values()}),
+                extra_filters=server_side_filters(group) or None
+            )
+            remote_dates = match_latest_dates(probe_rows, group)
+        except Exception as e:
+            logger.warning(f"探測最新報告日期失敗，改為完整抓取: {e}")
+            remote_dates = {}
+        
+        for commodity_name in list(group):
+            if is_up_to_date(latest_dates[commodity_name], remote_dates.get(commodity_name)):
+                logger.info(f"{commodity_name} 已是最新 ({latest_dates[commodity_name]})，略過抓取")
+                results[commodity_name] = True
+        group = {name: config for name, config in group.items() if name not in results}
+        if not group:
+            return results
+        
+        start_dates = {name: compute_start_date(latest_dates[name]) for name in group}
+        extra_filters = server_side_filters(group)
+        
+        rows = await api_client.fetch_batch(
+            api_endpoint=api_endpoint,
+            filter_field=filter_field,
+            filter_values=sorted({config['filter_value'] for config in group.values()}),
+            start_date=min(start_dates.values()),
+            extra_filters=extra_filters if extra_filters else None,
+            select_fields=api_client.build_select(list(group.values()))
+        )
+    except Exception as e:
+        logger.error(f"批次獲取 {', '.join(group)} 時發生錯誤: {e}", exc_info=True)
+        results.update({name: False for name in group})
+        return results
+    
+    sliced = split_rows_by_commodity(rows, group, start_dates)
+    for commodity_name, config in group.items():
+        logger.info(f"開始處理: {commodity_name} - {config['description']}")
+        try:
+            # 寫檔為同步 I/O，交給執行緒避免阻塞其他組的請求
+            results[commodity_name] = await asyncio.to_thread(
+                _update_commodity, commodity_name, processors[commodity_name], sliced[commodity_name]
+            )
+        except Exception as e:
+            logger.error(f"處理 {commodity_name} 時發生錯誤: {e}", exc_info=True)
+            results[commodity_name] = False
+    
+    return results
+
+
+async def _run_async(commodities: Dict[str, dict], batch: bool) -> Dict[str, bool]:
+    """在 event loop 內建立非同步客戶端並執行，結束後關閉 session"""
+    async with AsyncCFTCAPIClient() as api_client:
+        return await fetch_and_update_async(commodities, api_client, batch=batch)
+
+
+def mirror_available(config: dict) -> bool:
+    """商品是否設定從全市場鏡像導出，且所需欄位都在鏡像中"""
+    mirror = config.get('mirror')
+    if not mirror or mirror.get('dataset') not in UNIVERSE_DATASETS:
+        return False
+    fields = set(UNIVERSE_DATASETS[mirror['dataset']]['fields'])
+    required = {config['long_field'], config['short_field']} | set(config.get('extra_fields', []))
+    return required <= fields
+
+
+def update_from_mirror(commodity_name: str, config: dict, api_client: CFTCAPIClient) -> bool:
+    """
+    從本地全市場鏡像更新單一商品（鏡像只在有新發布時向 API 更新一次）
+    
+    鏡像無法更新時退回 fetch_and_update_commodity 直接查詢 API。
+    
+    Args:
+        commodity_name: 商品名稱
+        config: 商品配置（含 "mirror"）
+        api_client: API 客戶端
+        
+    Returns:
+        是否成功更新
+    """
+    mirror = config['mirror']
+    logger.info(f"\n{'='*60}")
+    logger.info(f"開始處理: {commodity_name} - {config['description']}（來源: {mirror['dataset']} 鏡像）")
+    logger.info(f"{'='*60}")
+    
+    if not refresh_mirror(mirror['dataset'], api_client):
+        logger.warning(f"{mirror['dataset']} 鏡像無法更新，{commodity_name} 改為直接查詢 API")
+        return fetch_and_update_commodity(commodity_name, config, api_client)
+    
+    try:
+        processor = COTDataProcessor(config)
+        latest_date = processor.get_latest_date()
+        
+        columns = [config['long_field'], config['short_field']] + list(config.get('extra_fields', []))
+        df = UniverseStore(mirror['dataset']).load(
+            columns=['open_interest'] + columns, markets=[mirror['market']]
+        )
+        df['report_date'] = pd.to_datetime(df['report_date']).dt.strftime('%Y-%m-%d')
+        
+        if is_up_to_date(latest_date, df['report_date'].max() if not df.empty else None):
+            logger.info(f"{commodity_name} 已是最新 ({latest_date})，略過更新")
+            return True
+        
+        df = df[df['report_date'] >= compute_start_date(latest_date)]
+        raw_data = mirror_rows(df)
+        return _update_commodity(commodity_name, processor, raw_data)
         
     except Exception as e:
         logger.error(f"處理 {commodity_name} 時發生錯誤: {e}", exc_info=True)
         return False
 
 
-def main():
-    """主函數"""
+def mirror_rows(df: pd.DataFrame) -> List[dict]:
+    """將鏡像的長格式數據轉回 API 欄位名稱的字典列表，交給 COTDataProcessor.update 處理"""
+    # 鏡像的數值欄位為 float64，部位是整數，轉回整數以維持 CSV 格式
+    numeric = df.columns.difference(['market', 'report_date'])
+    df = df.assign(**{col: df[col].round().astype('Int64') for col in numeric})
+    df = df.rename(columns={
+        'report_date': 'report_date_as_yyyy_mm_dd',
+        'open_interest': 'open_interest_all',
+    }).drop(columns=['market'])
+    return df.to_dict('records')
+
+
+def _update_commodity(commodity_name: str, processor: COTDataProcessor, raw_data: List[dict]) -> bool:
+    """將單一商品的原始數據交給處理器更新並記錄結果"""
+    if not raw_data:
+        logger.warning(f"{commodity_name} 沒有新數據")
+        return False
+    
+    # 更新數據
+    success = processor.update(raw_data)
+    
+    if success:
+        logger.info(f"✓ {commodity_name} 數據更新成功")
+    else:
+        logger.error(f"✗ {commodity_name} 數據更新失敗")
+    
+    return success
+
+
+def main(batch: bool = True, use_async: bool = False, universe: bool = False):
+    """
+    主函數
+    
+    Args:
+        batch: 是否以批次模式執行（每個 API 端點一次查詢）
+        use_async: 是否使用非同步客戶端並行處理
+        universe: 是否另外更新全市場鏡像（UNIVERSE_DATASETS）
+    """
     logger.info(f"\n{'#'*60}")
     logger.info(f"COT 數據抓取器啟動")
     logger.info(f"執行時間: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -105,10 +540,33 @@ def main():
     failed_commodities = []
     
     try:
+        # 設定從全市場鏡像導出的商品不另外查詢 API
+        mirrored = {name: config for name, config in COMMODITIES.items() if mirror_available(config)}
+        commodities = {name: config for name, config in COMMODITIES.items() if name not in mirrored}
+        
         # 處理每個商品
-        for commodity_name, config in COMMODITIES.items():
-            success = fetch_and_update_commodity(commodity_name, config, api_client)
-            
+        if use_async:
+            results = asyncio.run(_run_async(commodities, batch))
+        elif batch:
+            results = fetch_and_update_batch(commodities, api_client)
+        else:
+            results = {
+                commodity_name: fetch_and_update_commodity(commodity_name, config, api_client)
+                for commodity_name, config in commodities.items()
+            }
+        
+        results.update({
+            commodity_name: update_from_mirror(commodity_name, config, api_client)
+            for commodity_name, config in mirrored.items()
+        })
+        
+        if universe:
+            results.update({
+                f"universe:{name}": success
+                for name, success in run_universe(api_client).items()
+            })
+        
+        for commodity_name, success in results.items():
             if success:
                 success_count += 1
             else:
@@ -118,7 +576,7 @@ def main():
         logger.info(f"\n{'='*60}")
         logger.info(f"執行完成")
         logger.info(f"{'='*60}")
-        logger.info(f"成功: {success_count}/{len(COMMODITIES)}")
+        logger.info(f"成功: {success_count}/{len(results)}")
         
         if failed_commodities:
             logger.warning(f"失敗: {', '.join(failed_commodities)}")
@@ -137,4 +595,22 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="COT 數據抓取器")
+    parser.add_argument(
+        "--no-batch",
+        action="store_true",
+        help="逐一商品查詢，不合併同一端點的請求"
+    )
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="使用非同步客戶端並行處理（並行數與速率見 config.py）"
+    )
+    parser.add_argument(
+        "--universe",
+        action="store_true",
+        help="另外更新所有合約市場的全市場鏡像（data/universe/）"
+    )
+    args = parser.parse_args()
+    main(batch=not args.no_batch, use_async=args.use_async, universe=args.universe)
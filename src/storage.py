@@ -0,0 +1,208 @@
+"""
+COT 數據儲存後端
+CSV 為預設格式；Parquet / Feather 為欄式格式（需安裝 pyarrow），
+日期與整數欄位以原生型別儲存，載入時不需重新解析，且可只讀取需要的欄位。
+欄式後端儲存時會同時匯出 CSV，供 examples/ 等既有讀取端繼續使用。
+"""
+
+import importlib.util
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+
+import pandas as pd
+
+from tail_reader import head_records
+
+logger = logging.getLogger(__name__)
+
+# 以整數儲存的欄位（允許缺值，使用 pandas nullable Int64）
+INT_COLUMNS = ['open_interest', 'long_positions', 'short_positions', 'net_positions']
+
+
+class CSVStorage:
+    """CSV 儲存後端（日期以 YYYY-MM-DD 字串儲存，依日期由新到舊排序）"""
+    
+    format = 'csv'
+    
+    def __init__(self, csv_file: Path):
+        """
+        Args:
+            csv_file: CSV 檔案路徑
+        """
+        self.path = Path(csv_file)
+    
+    def exists(self) -> bool:
+        """檔案是否存在"""
+        return self.path.exists()
+    
+    def load(self, columns: Optional[List[str]] = None, nrows: Optional[int] = None) -> pd.DataFrame:
+        """
+        載入數據（report_date 維持字串）
+        
+        Args:
+            columns: 只讀取這些欄位，None 為全部
+            nrows: 只讀取最前面（最新）的筆數，None 為全部
+        
+        Returns:
+            DataFrame
+        """
+        return pd.read_csv(self.path, usecols=columns, nrows=nrows)
+    
+    def latest_date(self) -> Optional[str]:
+        """最新報告日期 (YYYY-MM-DD)；檔案依日期由新到舊排序，只需讀第一筆（不經過 pandas）"""
+        recent = head_records(self.path, 1)
+        return (recent[0].get('report_date') or None) if recent else None
+    
+    def save(self, df: pd.DataFrame):
+        """原子寫入 CSV"""
+        with atomic_writer(self.path) as f:
+            df.to_csv(f, index=False)
+
+
+class ColumnarStorage:
+    """
+    Parquet / Feather 儲存後端
+    
+    report_date 存為 datetime64、部位欄位存為 Int64；
+    save() 同時匯出與 CSVStorage 相同格式的 CSV。
+    """
+    
+    def __init__(self, csv_file: Path, format: str = 'parquet'):
+        """
+        Args:
+            csv_file: 匯出用的 CSV 檔案路徑，欄式檔案放在同目錄、同檔名換副檔名
+            format: 'parquet' 或 'feather'
+        """
+        if format not in ('parquet', 'feather'):
+            raise ValueError(f"不支援的儲存格式: {format}")
+        self.format = format
+        self.csv = CSVStorage(csv_file)
+        self.path = Path(csv_file).with_suffix(f'.{format}')
+    
+    def exists(self) -> bool:
+        """欄式檔案是否存在（尚未轉換時沿用既有 CSV）"""
+        return self.path.exists() or self.csv.exists()
+    
+    def load(self, columns: Optional[List[str]] = None, nrows: Optional[int] = None) -> pd.DataFrame:
+        """
+        載入數據（report_date 轉為 YYYY-MM-DD 字串，與 CSVStorage 一致）
+        
+        Args:
+            columns: 只讀取這些欄位，None 為全部
+            nrows: 只取最新的筆數，None 為全部
+        
+        Returns:
+            DataFrame
+        """
+        df = self.load_typed(columns)
+        if nrows is not None:
+            df = df.head(nrows)
+        if 'report_date' in df.columns:
+            df['report_date'] = df['report_date'].dt.strftime('%Y-%m-%d')
+        return df
+    
+    def load_typed(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        載入原生型別的數據（report_date 為 datetime64），不做任何字串解析
+        
+        Args:
+            columns: 只讀取這些欄位，None 為全部
+        
+        Returns:
+            DataFrame
+        """
+        if not self.path.exists():
+            # 第一次切換到欄式格式時，從既有 CSV 轉入
+            logger.info(f"未找到 {self.path.name}，從 {self.csv.path.name} 轉入")
+            return self._to_typed(self.csv.load(columns=columns))
+        if self.format == 'parquet':
+            return pd.read_parquet(self.path, columns=columns)
+        return pd.read_feather(self.path, columns=columns)
+    
+    def latest_date(self) -> Optional[str]:
+        """最新報告日期 (YYYY-MM-DD)，只讀取 report_date 欄"""
+        dates = self.load_typed(columns=['report_date'])['report_date']
+        return None if dates.empty else dates.max().strftime('%Y-%m-%d')
+    
+    def save(self, df: pd.DataFrame):
+        """寫入欄式檔案並匯出 CSV"""
+        typed = self._to_typed(df).reset_index(drop=True)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp")
+        os.close(fd)
+        try:
+            if self.format == 'parquet':
+                typed.to_parquet(tmp_path, index=False)
+            else:
+                typed.to_feather(tmp_path)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        self.csv.save(df)
+    
+    @staticmethod
+    def _to_typed(df: pd.DataFrame) -> pd.DataFrame:
+        """將字串日期與數值欄位轉為原生型別"""
+        df = df.copy()
+        if 'report_date' in df.columns:
+            df['report_date'] = pd.to_datetime(df['report_date'])
+        for col in INT_COLUMNS:
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors='coerce').round().astype('Int64')
+        return df
+
+
+def create_storage(csv_file: Path, backend: str = 'csv'):
+    """
+    依設定建立儲存後端
+    
+    Args:
+        csv_file: CSV 檔案路徑（欄式後端用來決定檔名並匯出 CSV）
+        backend: 'csv'、'parquet' 或 'feather'
+    
+    Returns:
+        CSVStorage 或 ColumnarStorage
+    """
+    backend = (backend or 'csv').lower()
+    if backend == 'csv':
+        return CSVStorage(csv_file)
+    if importlib.util.find_spec('pyarrow') is None:
+        logger.error(f"{backend} 儲存需要安裝 pyarrow，改用 CSV")
+        return CSVStorage(csv_file)
+    return ColumnarStorage(csv_file, format=backend)
+
+
+class atomic_writer:
+    """寫入同目錄下的暫存檔，完成後以 os.replace 原子替換目標檔案；發生例外時保留原檔"""
+    
+    def __init__(self, target: Path):
+        self.target = Path(target)
+        self.tmp_path = None
+        self.file = None
+    
+    def __enter__(self):
+        self.target.parent.mkdir(parents=True, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(
+            dir=self.target.parent, prefix=f".{self.target.name}.", suffix=".tmp"
+        )
+        self.file = os.fdopen(fd, 'w', encoding='utf-8', newline='')
+        return self.file
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.file.close()
+        if exc_type is None:
+            # mkstemp 建立的檔案權限為 0600，沿用原檔權限（新檔則用一般的 0644）
+            if self.target.exists():
+                shutil.copymode(self.target, self.tmp_path)
+            else:
+                os.chmod(self.tmp_path, 0o644)
+            os.replace(self.tmp_path, self.target)
+        else:
+            os.unlink(self.tmp_path)
+        return False
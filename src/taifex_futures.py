@@ -0,0 +1,156 @@
+"""
+TAIFEX 期貨每日交易行情快照
+openapi.taifex.com.tw 的 DailyMarketReportFut 只提供最新一個交易日、所有契約（TX、MTX、TE、TF…）
+所有月份與交易時段的行情。這裡每個交易日只下載一次，一次向量化轉成型別化的逐契約表格，
+存成 data/taifex_fut/DailyMarketReportFut_<交易日>.csv（只保留最新一份）；
+taifex_monitor 與 cboe_pcr_scraper 從同一份表格取各自需要的部分。
+CI 上兩個工作流程以同一組 actions/cache 鍵共用這個目錄。
+"""
+
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+import requests
+
+logger = logging.getLogger(__name__)
+
+URL = "https://openapi.taifex.com.tw/v1/DailyMarketReportFut"
+SNAPSHOT_DIR = Path(__file__).resolve().parent.parent / "data" / "taifex_fut"
+SNAPSHOT_STATE = SNAPSHOT_DIR / "latest.json"
+
+# 字串欄位（其餘已知欄位轉為數值；"-"、空白轉為 NaN）
+KEY_COLUMNS = ["Date", "Contract", "ContractMonth(Week)", "TradingSession"]
+NUMERIC_COLUMNS = [
+    "StrikePrice", "Open", "High", "Low", "Last", "Change", "Volume",
+    "SettlementPrice", "OpenInterest", "BestBid", "BestAsk", "HistoricalHigh", "HistoricalLow",
+]
+
+TAIPEI = timezone(timedelta(hours=8))
+
+_snapshot: Optional[pd.DataFrame] = None
+
+
+def expected_trade_date(now: Optional[datetime] = None) -> str:
+    """
+    最新一份行情可能對應的交易日（台北時間今天，週末退回週五）
+    
+    快照的 Date 已是這一天時不可能有更新的資料；較早時（當天尚未公布或遇到休市）重新下載確認。
+    
+    Args:
+        now: 目前時間（含時區），None 為現在
+    
+    Returns:
+        交易日 (YYYYMMDD，與 API 的 Date 欄位相同格式)
+    """
+    day = (now or datetime.now(timezone.utc)).astimezone(TAIPEI).date()
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day.strftime("%Y%m%d")
+
+
+def to_table(records: list) -> pd.DataFrame:
+    """
+    將 API 回傳一次轉成型別化表格
+    
+    Args:
+        records: API 回傳的字典列表
+    
+    Returns:
+        DataFrame：字串欄位去除前後空白，數值欄位去掉千分位逗號後轉為 float
+    """
+    table = pd.DataFrame(records)
+    numeric = [c for c in NUMERIC_COLUMNS if c in table.columns]
+    text = [c for c in table.columns if c not in numeric and pd.api.types.is_string_dtype(table[c])]
+    table[text] = table[text].apply(lambda col: col.str.strip())
+    table[numeric] = table[numeric].apply(
+        lambda col: pd.to_numeric(col.astype(str).str.replace(",", "", regex=False).str.strip(), errors="coerce")
+    )
+    return table
+
+
+def _snapshot_path(trade_date: str) -> Path:
+    return SNAPSHOT_DIR / f"DailyMarketReportFut_{trade_date}.csv"
+
+
+def _read_snapshot(path: Path) -> pd.DataFrame:
+    return pd.read_csv(path, dtype={c: str for c in KEY_COLUMNS}, keep_default_na=False, na_values={
+        c: [""] for c in NUMERIC_COLUMNS
+    })
+
+
+def load_snapshot(refresh: bool = False, session=None) -> pd.DataFrame:
+    """
+    取得最新一個交易日的全契約表格
+    
+    同一行程內只下載一次；磁碟上快照的交易日已是 expected_trade_date() 時直接讀取，不發送請求。
+    
+    Args:
+        refresh: 強制重新下載
+        session: requests.Session
+    
+    Returns:
+        to_table() 的表格
+    
+    Raises:
+        requests.exceptions.RequestException / ValueError: 下載或解碼失敗
+    """
+    global _snapshot
+    if _snapshot is not None and not refresh:
+        return _snapshot
+    
+    if not refresh and SNAPSHOT_STATE.exists():
+        try:
+            state = json.loads(SNAPSHOT_STATE.read_text(encoding="utf-8"))
+            path = _snapshot_path(state["trade_date"])
+            if state["trade_date"] >= expected_trade_date() and path.exists():
+                logger.info(f"使用 TAIFEX 快照: {path}")
+                _snapshot = _read_snapshot(path)
+                return _snapshot
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"TAIFEX 快照狀態讀取失敗，重新下載: {e}")
+    
+    response = (session or requests).get(URL, timeout=20)
+    response.raise_for_status()
+    table = to_table(response.json())
+    if table.empty:
+        raise ValueError("TAIFEX DailyMarketReportFut 未回傳任何資料")
+    
+    trade_date = str(table["Date"].iloc[0]) if "Date" in table.columns else datetime.now(TAIPEI).strftime("%Y%m%d")
+    SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    path = _snapshot_path(trade_date)
+    tmp = path.with_name(path.name + ".tmp")
+    table.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+    for old in SNAPSHOT_DIR.glob("DailyMarketReportFut_*.csv"):
+        if old != path:
+            old.unlink()
+    SNAPSHOT_STATE.write_text(json.dumps({
+        "trade_date": trade_date,
+        "fetched_at": datetime.now(timezone.utc).isoformat(),
+    }), encoding="utf-8")
+    
+    _snapshot = table
+    return _snapshot
+
+
+def contract_rows(table: pd.DataFrame, contract: str, single_month: bool = False) -> pd.DataFrame:
+    """
+    取出單一契約的各月份資料
+    
+    Args:
+        table: load_snapshot() 的表格
+        contract: 契約代碼（TX、MTX、TE、TF…）
+        single_month: 只保留單一月份（YYYYMM），排除週契約與價差組合
+    
+    Returns:
+        依契約月份排序的子表格
+    """
+    rows = table[table["Contract"] == contract]
+    if single_month:
+        rows = rows[rows["ContractMonth(Week)"].str.len() == 6]
+    return rows.sort_values("ContractMonth(Week)", kind="stable")
@@ -0,0 +1,265 @@
+"""
+CSV 尾端讀取與日期索引
+歷史檔案多半依日期附加，查最新一筆或檢查某日是否存在時不需要讀入整個檔案：
+- tail_records / head_records：從檔尾往回（或從檔頭）只讀需要的幾行
+- DateIndex：旁置的日期 -> 位元組位置索引，存在性檢查為 O(1)；檔案只有附加時只掃描新增的部分
+- date_exists：檢查日期是否存在，晚於最後一筆時只讀檔尾
+- upsert_last_record：新增一筆（或覆寫最後一筆）而不重寫整個檔案
+
+只使用標準函式庫，可供不安裝 pandas 的腳本（例如 TIC_Dealer_monitor.py）使用。
+"""
+
+import csv
+import io
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+BLOCK_SIZE = 8192
+# 索引記錄檔尾這麼多位元組，用來判斷檔案是否只有附加（前面的內容沒被改寫）
+FINGERPRINT_SIZE = 64
+
+
+def _decode(data: bytes) -> str:
+    return data.decode('utf-8-sig')
+
+
+def read_header(path: Path) -> List[str]:
+    """讀取 CSV 標題列"""
+    with open(path, 'rb') as f:
+        line = f.readline()
+    return next(csv.reader([_decode(line).rstrip('\r\n')]), [])
+
+
+def tail_lines(path: Path, n: int) -> List[Tuple[int, bytes]]:
+    """
+    從檔尾往回讀取最後 n 行（不含標題列與空行）
+    
+    Returns:
+        [(該行的起始位元組位置, 該行內容)]，依檔案順序
+    """
+    with open(path, 'rb') as f:
+        header_end = len(f.readline())
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        pos = end
+        data = b''
+        # 往回讀到涵蓋 n 個完整行（多讀一個換行以確定第一行完整）或碰到標題列為止
+        while pos > header_end and data.count(b'\n') <= n:
+            step = min(BLOCK_SIZE, pos - header_end)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    
+    lines = []
+    offset = pos
+    for line in data.splitlines(keepends=True):
+        lines.append((offset, line))
+        offset += len(line)
+    if pos > header_end:
+        lines = lines[1:]  # 第一段可能只是某行的後半
+    return [(o, line) for o, line in lines if line.strip()][-n:]
+
+
+def tail_records(path: Path, n: int = 1) -> List[Dict[str, str]]:
+    """
+    讀取 CSV 最後 n 筆記錄
+    
+    Returns:
+        以標題列為鍵的字典列表，依檔案順序；檔案不存在或沒有記錄時為空列表
+    """
+    path = Path(path)
+    if not path.exists() or n <= 0:
+        return []
+    header = read_header(path)
+    lines = [_decode(line) for _, line in tail_lines(path, n)]
+    return list(csv.DictReader(io.StringIO(''.join(lines)), fieldnames=header))
+
+
+def head_records(path: Path, n: int = 1) -> List[Dict[str, str]]:
+    """讀取 CSV 最前面 n 筆記錄（依日期由新到舊排序的檔案用來取最新記錄）"""
+    path = Path(path)
+    if not path.exists() or n <= 0:
+        return []
+    records = []
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            records.append(row)
+            if len(records) >= n:
+                break
+    return records
+
+
+class DateIndex:
+    """
+    CSV 的旁置日期索引（同目錄的 .<檔名>.dates.json）
+    
+    記錄每個日期所在行的位元組位置。載入時比對檔案大小與尾端指紋：
+    檔案沒變直接使用；只有附加時只掃描新增的部分；其他情況（被改寫、排序）重建索引。
+    """
+    
+    def __init__(self, path: Path, column: str = 'Date'):
+        """
+        Args:
+            path: CSV 檔案路徑
+            column: 日期欄位名稱
+        """
+        self.path = Path(path)
+        self.column = column
+        self.index_path = self.path.with_name(f".{self.path.name}.dates.json")
+        self.offsets: Dict[str, int] = {}
+        self.size = 0
+        self.fingerprint = ''
+        self.refresh()
+    
+    def __contains__(self, date: str) -> bool:
+        return date in self.offsets
+    
+    def offset(self, date: str) -> Optional[int]:
+        """該日期所在行的起始位元組位置"""
+        return self.offsets.get(date)
+    
+    def refresh(self):
+        """讓索引與目前的檔案內容一致，必要時寫回旁置檔"""
+        if not self.path.exists():
+            self.offsets, self.size, self.fingerprint = {}, 0, ''
+            return
+        
+        size = self.path.stat().st_size
+        cached = self._load()
+        if cached and cached['size'] == size and cached['fingerprint'] == self._fingerprint(size):
+            self.offsets, self.size, self.fingerprint = cached['offsets'], size, cached['fingerprint']
+            return
+        
+        if cached and cached['size'] < size and cached['fingerprint'] == self._fingerprint(cached['size']):
+            # 只有附加：從上次的結尾繼續掃描
+            self.offsets = cached['offsets']
+            self._scan(cached['size'])
+        else:
+            self.offsets = {}
+            self._scan(None)
+        self.size = size
+        self.fingerprint = self._fingerprint(size)
+        self._save()
+    
+    def _fingerprint(self, size: int) -> str:
+        with open(self.path, 'rb') as f:
+            f.seek(max(0, size - FINGERPRINT_SIZE))
+            return f.read(min(size, FINGERPRINT_SIZE)).hex()
+    
+    def _scan(self, start: Optional[int]):
+        """從 start（None 為標題列之後）逐行掃描，只解析日期欄位"""
+        header = read_header(self.path)
+        if self.column not in header:
+            raise KeyError(f"{self.path} 沒有 {self.column} 欄位")
+        col = header.index(self.column)
+        with open(self.path, 'rb') as f:
+            if start is None:
+                f.readline()
+            else:
+                f.seek(start)
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                row = next(csv.reader([_decode(line).rstrip('\r\n')]))
+                if col < len(row) and row[col]:
+                    self.offsets[row[col]] = offset
+    
+    def _load(self) -> Optional[dict]:
+        if not self.index_path.exists():
+            return None
+        try:
+            cached = json.loads(self.index_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+        return cached if cached.get('column') == self.column else None
+    
+    def _save(self):
+        tmp = self.index_path.with_name(self.index_path.name + '.tmp')
+        tmp.write_text(json.dumps({
+            'column': self.column,
+            'size': self.size,
+            'fingerprint': self.fingerprint,
+            'offsets': self.offsets,
+        }), encoding='utf-8')
+        os.replace(tmp, self.index_path)
+
+
+def date_exists(path: Path, date: str, column: str = 'Date') -> bool:
+    """
+    檢查依日期遞增排序的 CSV 是否已有該日期
+    
+    晚於（或等於）最後一筆的日期只需讀檔尾；較早的日期才查旁置索引。
+    """
+    path = Path(path)
+    last = tail_records(path, 1)
+    if not last:
+        return False
+    last_date = last[0].get(column) or ''
+    if date >= last_date:
+        return date == last_date
+    return date in DateIndex(path, column)
+
+
+def _format_row(header: List[str], record: Dict, terminator: str) -> str:
+    buffer = io.StringIO()
+    values = []
+    for col in header:
+        value = record.get(col)
+        # None / NaN 寫成空值，與 pandas to_csv 相同
+        values.append('' if value is None or value != value else value)
+    csv.writer(buffer, lineterminator=terminator).writerow(values)
+    return buffer.getvalue()
+
+
+def upsert_last_record(path: Path, record: Dict, column: str = 'Date') -> bool:
+    """
+    依日期新增一筆記錄到依日期遞增排序的 CSV 尾端，或覆寫同日期的最後一筆，不重寫整個檔案
+    
+    Args:
+        path: CSV 檔案路徑（需已存在且有標題列）
+        record: {欄位: 值}；沒有的欄位寫入空值
+        column: 日期欄位名稱
+    
+    Returns:
+        是否完成；以下情況回傳 False，由呼叫端改用整檔讀寫：
+        檔案不存在、record 有標題列沒有的欄位、或日期早於最後一筆
+    """
+    path = Path(path)
+    if not path.exists():
+        return False
+    header = read_header(path)
+    if column not in header or set(record) - set(header):
+        return False
+    
+    date = str(record[column])
+    last = tail_lines(path, 1)
+    terminator = '\n'
+    write_at = None
+    if last:
+        offset, line = last[0]
+        terminator = '\r\n' if line.endswith(b'\r\n') else '\n'
+        row = next(csv.reader([_decode(line).rstrip('\r\n')]))
+        last_date = row[header.index(column)] if header.index(column) < len(row) else ''
+        if date < last_date:
+            return False
+        if date == last_date:
+            write_at = offset
+    
+    with open(path, 'r+b') as f:
+        if write_at is not None:
+            f.truncate(write_at)
+            f.seek(write_at)
+        else:
+            f.seek(0, os.SEEK_END)
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    f.write(terminator.encode('utf-8'))
+        f.write(_format_row(header, record, terminator).encode('utf-8'))
+    return True
@@ -0,0 +1,373 @@
+"""
+CFTC 全市場鏡像
+以每個端點少數幾次分頁批量查詢，追蹤分類報告 (disaggregated) 與 TFF 報告中的所有合約市場，
+存成一份以 (market, report_date) 為索引的長格式檔案；單一市場的數據再依需要從中導出
+
+這份鏡像也是其他腳本（cot_scoring、market_data_collector、cboe_pcr_scraper）共用的
+本地數據來源：鏡像只由 src/main.py（daily_fetch 工作流程）依 CFTC 的發布時程更新並 commit，
+read_mirror() 預設只讀取本地檔案，不發送網路請求
+"""
+
+import importlib.util
+import logging
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from config import UNIVERSE_DIR, UNIVERSE_DATASETS, UNIVERSE_HISTORY_DAYS
+from cftc_api import CFTCAPIClient
+from storage import atomic_writer
+
+logger = logging.getLogger(__name__)
+
+# 長格式儲存的索引欄位
+KEY_COLUMNS = ['market', 'report_date']
+
+# API 欄位 -> 儲存欄位
+BASE_FIELDS = {
+    'cftc_contract_market_code': 'market',
+    'market_and_exchange_names': 'market_name',
+    'report_date_as_yyyy_mm_dd': 'report_date',
+    'open_interest_all': 'open_interest',
+}
+
+# CFTC 每週五美東 15:30 發布當週二的部位；以冬令時間換算為 UTC 20:30（夏令時間時會晚一小時才判定為已發布）
+RELEASE_WEEKDAY = 4
+RELEASE_HOUR_UTC = 20
+RELEASE_MINUTE_UTC = 30
+
+# 本行程中已確認為最新的數據集，避免同一次執行重複探測
+_fresh_datasets = set()
+
+
+class UniverseStore:
+    """
+    全市場長格式儲存
+    
+    report_date 為 datetime64、數值欄位為 float64，依 (market, report_date) 排序且不重複。
+    一律存一份 CSV；有安裝 pyarrow 時另存 Parquet 並優先讀取（可只讀取需要的欄位與市場），
+    沒有 pyarrow 的讀取端（例如只裝了 pandas 的排程）仍可讀取同一份鏡像。
+    """
+    
+    def __init__(self, name: str, directory: Path = UNIVERSE_DIR):
+        """
+        Args:
+            name: 數據集名稱（UNIVERSE_DATASETS 的 key）
+            directory: 儲存目錄
+        """
+        self.name = name
+        self.use_parquet = importlib.util.find_spec('pyarrow') is not None
+        self.csv_path = Path(directory) / f"{name}.csv"
+        self.parquet_path = Path(directory) / f"{name}.parquet"
+        self.path = self.parquet_path if self.use_parquet else self.csv_path
+        self.catalog_path = Path(directory) / f"{name}_markets.csv"
+    
+    def exists(self) -> bool:
+        """檔案是否存在"""
+        return self.path.exists() or self.csv_path.exists()
+    
+    def load(self, columns: Optional[List[str]] = None, markets: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        載入長格式數據
+        
+        Args:
+            columns: 只讀取這些欄位（索引欄位一律包含），None 為全部
+            markets: 只讀取這些市場代碼，None 為全部
+        
+        Returns:
+            DataFrame，檔案不存在時回傳空 DataFrame
+        """
+        if not self.exists():
+            return pd.DataFrame(columns=list(BASE_FIELDS.values()))
+        if columns is not None:
+            columns = list(dict.fromkeys(KEY_COLUMNS + list(columns)))
+        
+        if self.use_parquet and self.parquet_path.exists():
+            filters = [('market', 'in', list(markets))] if markets else None
+            return pd.read_parquet(self.parquet_path, columns=columns, filters=filters)
+        
+        df = pd.read_csv(self.csv_path, usecols=columns, dtype={'market': str}, parse_dates=['report_date'])
+        if markets:
+            df = df[df['market'].isin(markets)].reset_index(drop=True)
+        return df
+    
+    def latest_date(self) -> Optional[str]:
+        """所有市場中的最新報告日期 (YYYY-MM-DD)"""
+        dates = self.load(columns=['report_date'])['report_date']
+        return None if dates.empty else pd.Timestamp(dates.max()).strftime('%Y-%m-%d')
+    
+    def upsert(self, new_data: pd.DataFrame) -> pd.DataFrame:
+        """
+        以 (market, report_date) 為鍵合併新數據（新數據優先）並儲存
+        
+        Args:
+            new_data: columns_to_frame 產生的長格式數據（market, market_name, report_date, open_interest 與各數值欄位）
+        
+        Returns:
+            合併後的完整數據
+        """
+        existing = self.load()
+        if existing.empty:
+            merged = new_data
+        else:
+            merged = pd.concat([existing, new_data], ignore_index=True)
+            merged.drop_duplicates(subset=KEY_COLUMNS, keep='last', inplace=True)
+        merged = merged.sort_values(KEY_COLUMNS).reset_index(drop=True)
+        self.save(merged)
+        return merged
+    
+    def save(self, df: pd.DataFrame):
+        """原子寫入（Parquet 與 CSV）"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.use_parquet:
+            tmp_path = self.parquet_path.with_name(f".{self.parquet_path.name}.tmp")
+            df.to_parquet(tmp_path, index=False)
+            tmp_path.replace(self.parquet_path)
+        with atomic_writer(self.csv_path) as f:
+            df.to_csv(f, index=False, date_format='%Y-%m-%d')
+        logger.info(f"全市場數據已儲存至: {self.path} ({len(df)} 筆)")
+    
+    def save_catalog(self, markets: List[Dict]):
+        """儲存合約市場清單（代碼、名稱、最新報告日期）"""
+        catalog = pd.DataFrame(markets).rename(columns=BASE_FIELDS)
+        catalog = catalog.sort_values('market').reset_index(drop=True)
+        with atomic_writer(self.catalog_path) as f:
+            catalog.to_csv(f, index=False)
+    
+    def market_frame(self, market: str, long_field: str, short_field: str) -> pd.DataFrame:
+        """
+        導出單一市場的數據，格式與 COTDataProcessor 的輸出相同
+        
+        Args:
+            market: cftc_contract_market_code
+            long_field: 多單欄位（API 欄位名稱）
+            short_field: 空單欄位（API 欄位名稱）
+        
+        Returns:
+            report_date, open_interest, long_positions, short_positions, net_positions
+            （依日期由新到舊排序）
+        """
+        df = self.load(columns=['open_interest', long_field, short_field], markets=[market])
+        df = df.rename(columns={long_field: 'long_positions', short_field: 'short_positions'})
+        df['net_positions'] = df['long_positions'] - df['short_positions']
+        for col in ['open_interest', 'long_positions', 'short_positions', 'net_positions']:
+            df[col] = df[col].round().astype('Int64')
+        df['report_date'] = pd.to_datetime(df['report_date']).dt.strftime('%Y-%m-%d')
+        df = df.sort_values('report_date', ascending=False)
+        return df[['report_date', 'open_interest', 'long_positions', 'short_positions', 'net_positions']]
+    
+    def export_market(self, market: str, long_field: str, short_field: str, output_file: Path) -> bool:
+        """
+        將單一市場的數據寫成 CSV（與 data/*_cot_data.csv 相同格式）
+        
+        Returns:
+            是否有數據可寫出
+        """
+        df = self.market_frame(market, long_field, short_field)
+        if df.empty:
+            logger.warning(f"全市場數據中找不到市場代碼 {market}")
+            return False
+        with atomic_writer(Path(output_file)) as f:
+            df.to_csv(f, index=False)
+        logger.info(f"已導出 {market} 至 {output_file} ({len(df)} 筆)")
+        return True
+
+
+def columns_to_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    將 fetch_columns 取回的型別化欄位轉為長格式 DataFrame
+    
+    Args:
+        df: 以 API 欄位名稱為欄的 DataFrame
+    
+    Returns:
+        market, market_name, report_date, open_interest 與各數值欄位
+    """
+    df = df.rename(columns=BASE_FIELDS)
+    df['report_date'] = df['report_date'].astype('datetime64[ns]')
+    return df
+
+
+def stream_fields(fields: List[str]) -> Dict[str, str]:
+    """fetch_columns 使用的 {API 欄位: 型別} 對照"""
+    spec = {
+        'cftc_contract_market_code': 'str',
+        'market_and_exchange_names': 'str',
+        'report_date_as_yyyy_mm_dd': 'date',
+        'open_interest_all': 'float',
+    }
+    spec.update({field: 'float' for field in fields})
+    return spec
+
+
+def update_universe(name: str, dataset: Dict, api_client) -> bool:
+    """
+    更新單一數據集的全市場鏡像
+    
+    先以一次聚合查詢列出所有市場（同時作為新鮮度探測），沒有新報告就略過；
+    否則以分頁批量查詢抓取所有市場自重疊窗口起的數據（邊下載邊解碼成型別化欄位），合併後寫回。
+    
+    Args:
+        name: 數據集名稱
+        dataset: UNIVERSE_DATASETS 中的配置
+        api_client: CFTCAPIClient
+    
+    Returns:
+        是否成功（已是最新也視為成功）
+    """
+    logger.info(f"\n{'='*60}")
+    logger.info(f"全市場更新: {name}")
+    logger.info(f"{'='*60}")
+    
+    store = UniverseStore(name)
+    extra_filters = dataset.get('extra_filters') or {}
+    
+    try:
+        markets = api_client.discover_markets(dataset['api_endpoint'], extra_filters or None)
+        logger.info(f"{name} 共 {len(markets)} 個合約市場")
+        if markets:
+            store.save_catalog(markets)
+        
+        stored_latest = store.latest_date()
+        remote_latest = max((m['latest_report_date'] for m in markets if m.get('latest_report_date')), default=None)
+        if stored_latest and remote_latest and remote_latest <= stored_latest:
+            logger.info(f"{name} 已是最新 ({stored_latest})，略過抓取")
+            return True
+        
+        if stored_latest:
+            # 從最新日期的前一週開始抓取（確保不遺漏修正）
+            start = datetime.strptime(stored_latest, '%Y-%m-%d') - timedelta(days=7)
+        else:
+            start = datetime.now() - timedelta(days=UNIVERSE_HISTORY_DAYS)
+        
+        where_clause = f"report_date_as_yyyy_mm_dd >= '{start.strftime('%Y-%m-%d')}'"
+        for field, value in extra_filters.items():
+            where_clause += f" AND {field} = '{value}'"
+        
+        new_data = api_client.fetch_columns(
+            dataset['api_endpoint'],
+            where_clause,
+            stream_fields(dataset['fields']),
+            label=name
+        )
+        logger.info(f"{name} 取得 {len(new_data)} 筆數據")
+        if new_data.empty:
+            return True
+        
+        store.upsert(columns_to_frame(new_data))
+        return True
+    
+    except Exception as e:
+        logger.error(f"全市場更新 {name} 時發生錯誤: {e}", exc_info=True)
+        return False
+
+
+def run_universe(api_client, datasets: Dict[str, Dict] = UNIVERSE_DATASETS) -> Dict[str, bool]:
+    """
+    更新所有設定的全市場數據集
+    
+    Returns:
+        {數據集名稱: 是否成功}
+    """
+    return {name: update_universe(name, dataset, api_client) for name, dataset in datasets.items()}
+
+
+def latest_release_time(now: Optional[datetime] = None) -> datetime:
+    """
+    最近一次已過的 CFTC 發布時間
+    
+    Args:
+        now: 目前時間（UTC），None 為現在
+    
+    Returns:
+        發布時間（UTC，含時區）
+    """
+    now = now or datetime.now(timezone.utc)
+    release = (now - timedelta(days=(now.weekday() - RELEASE_WEEKDAY) % 7)).replace(
+        hour=RELEASE_HOUR_UTC, minute=RELEASE_MINUTE_UTC, second=0, microsecond=0
+    )
+    if release > now:
+        release -= timedelta(days=7)
+    return release
+
+
+def expected_report_date(now: Optional[datetime] = None) -> str:
+    """
+    依 CFTC 發布時程推算目前應已公布的最新報告日期
+    
+    Args:
+        now: 目前時間（UTC），None 為現在
+    
+    Returns:
+        最近一次已過發布時間的週五所對應的週二 (YYYY-MM-DD)
+    """
+    return (latest_release_time(now) - timedelta(days=3)).strftime('%Y-%m-%d')
+
+
+def refresh_mirror(name: str, api_client=None) -> bool:
+    """
+    需要時才更新鏡像：已涵蓋最近一次發布的報告就不發送任何請求
+    
+    遇到假日延後發布時，推算的日期尚未公布，會以一次聚合查詢探測後略過，
+    同一行程內不會重複探測。
+    
+    Args:
+        name: 數據集名稱（UNIVERSE_DATASETS 的 key）
+        api_client: CFTCAPIClient，None 時臨時建立
+    
+    Returns:
+        鏡像是否為最新（更新失敗時為 False）
+    """
+    if name in _fresh_datasets:
+        return True
+    
+    store = UniverseStore(name)
+    stored_latest = store.latest_date() if store.exists() else None
+    if stored_latest and stored_latest >= expected_report_date():
+        logger.info(f"{name} 鏡像已涵蓋最近一次發布 ({stored_latest})")
+        _fresh_datasets.add(name)
+        return True
+    
+    client = api_client or CFTCAPIClient()
+    try:
+        success = update_universe(name, UNIVERSE_DATASETS[name], client)
+    finally:
+        if api_client is None:
+            client.close()
+    if success:
+        _fresh_datasets.add(name)
+    return success
+
+
+def read_mirror(
+    name: str,
+    columns: Optional[List[str]] = None,
+    markets: Optional[List[str]] = None,
+    refresh: bool = False
+) -> pd.DataFrame:
+    """
+    從本地鏡像讀取任意欄位與市場的切片
+    
+    Args:
+        name: 數據集名稱（'tff' 或 'disaggregated'）
+        columns: 只讀取這些欄位（儲存欄位名稱，例如 'open_interest' 或 API 的部位欄位），None 為全部
+        markets: 只讀取這些市場代碼（cftc_contract_market_code），None 為全部
+        refresh: 是否先確認鏡像為最新（需要時向 API 更新；一般由 src/main.py 負責）
+    
+    Returns:
+        長格式 DataFrame，依 (market, report_date) 排序
+    
+    Raises:
+        FileNotFoundError: 鏡像不存在且無法建立
+    """
+    store = UniverseStore(name)
+    if refresh and not refresh_mirror(name) and store.exists():
+        logger.warning(f"{name} 鏡像更新失敗，使用既有數據 ({store.latest_date()})")
+    if not store.exists():
+        raise FileNotFoundError(f"找不到 {name} 鏡像: {store.path}")
+    df = store.load(columns=columns, markets=markets)
+    if not refresh and not df.empty and df['report_date'].max() < pd.Timestamp(expected_report_date()):
+        logger.info(f"{name} 鏡像尚未涵蓋最近一次發布（最新 {df['report_date'].max():%Y-%m-%d}），等待 daily_fetch 更新")
+    return df
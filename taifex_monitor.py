@@ -1,33 +1,50 @@
 import requests
 import pandas as pd
 import datetime
+import hashlib
 import os
 import json
 import re
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from io import StringIO, BytesIO
 from bs4 import BeautifulSoup
 
+# 共用 src/ 的條件式請求快取
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from http_cache import cached_get
+from taifex_futures import load_snapshot, contract_rows
+
 # 設定 CSV 檔案路徑
 CSV_FILE = 'market_monitor.csv'
 
+# 期貨商財務資料列表頁與 ODS 不常更新；沒有 ETag / Last-Modified 時以這些秒數判斷快取是否可用
+FCM_LIST_TTL = 6 * 3600
+FCM_ODS_TTL = 7 * 24 * 3600
+# 解析後的期貨商表格（Broker, Asset, ANC）與對應的 ODS 網址、內容雜湊；出現新檔案時才重新解析
+FCM_CACHE_TABLE = os.path.join('data', 'taifex_fcm', 'broker_anc.csv')
+FCM_CACHE_STATE = os.path.join('data', 'taifex_fcm', 'state.json')
+
+# 四個來源同時抓取；各自的截止秒數（從開始抓取起算），逾時視同抓取失敗
+SOURCE_DEADLINES = {
+    'tx': 30,       # TAIFEX OpenAPI
+    'margin': 30,   # TWSE OpenAPI
+    'cp': 30,       # TBFA
+    'anc': 60,      # TAIFEX 網站列表頁 + ODS 下載與解析
+}
+
 def get_tx_futures():
-    """抓取台指期近月收盤價與 OI"""
-    url = "https://openapi.taifex.com.tw/v1/DailyMarketReportFut"
+    """抓取台指期近月收盤價與 OI（讀取共用的 TAIFEX 全契約快照）"""
     try:
-        response = requests.get(url, timeout=15)
-        data = response.json()
-        df = pd.DataFrame(data)
-        tx_df = df[df['Contract'] == 'TX'].copy()
-        tx_df = tx_df[tx_df['ContractMonth(Week)'].str.len() == 6]
-        tx_df = tx_df.sort_values('ContractMonth(Week)')
+        tx_df = contract_rows(load_snapshot(), 'TX', single_month=True)
         if tx_df.empty: 
             print("TX Futures data is empty.")
             return {'tx_price': None, 'tx_oi': None}
         latest_month = tx_df.iloc[0]
         return {
-            'tx_price': float(latest_month['Last']) if latest_month['Last'] else None,
-            'tx_oi': int(latest_month['OpenInterest']) if latest_month['OpenInterest'] else None
+            'tx_price': None if pd.isna(latest_month['Last']) else float(latest_month['Last']),
+            'tx_oi': None if pd.isna(latest_month['OpenInterest']) else int(latest_month['OpenInterest'])
         }
     except Exception as e:
         print(f"Error fetching TX Futures: {e}")
@@ -50,92 +67,131 @@ def get_margin_balance():
         print(f"Error fetching Margin Balance: {e}")
         return None
 
-def get_anc_ratio():
-    """從期交所 ODS 檔解析：全市場 ANC 最低值、與前四大期貨商 ANC 最低值"""
+def find_fcm_ods_url():
+    """從期交所期貨商財務資料列表頁找出「專營期貨商簡明財務資料表」ODS 的網址"""
     list_url = "https://www.taifex.com.tw/cht/8/fcmFinancial"
-    try:
-        resp = requests.get(list_url, timeout=15)
-        soup = BeautifulSoup(resp.text, 'html.parser')
-        ods_url = None
-        for a in soup.find_all('a', href=True):
-            if '專營期貨商簡明財務資料表' in a.get_text() and '.ods' in a['href']:
-                href = a['href']
-                if href.startswith('http'):
-                    ods_url = href
-                else:
-                    ods_url = "https://www.taifex.com.tw" + (href if href.startswith('/') else "/cht/8/" + href)
-                break
-        
-        if not ods_url:
-            match = re.search(r'href="([^"]*專營期貨商簡明財務資料表[^"]*\.ods)"', resp.text)
-            if match:
-                href = match.group(1)
-                ods_url = href if href.startswith('http') else "https://www.taifex.com.tw" + (href if href.startswith('/') else "/cht/8/" + href)
+    resp = cached_get(list_url, ttl=FCM_LIST_TTL, timeout=15)
+    soup = BeautifulSoup(resp.text, 'html.parser')
+    ods_url = None
+    for a in soup.find_all('a', href=True):
+        if '專營期貨商簡明財務資料表' in a.get_text() and '.ods' in a['href']:
+            href = a['href']
+            if href.startswith('http'):
+                ods_url = href
+            else:
+                ods_url = "https://www.taifex.com.tw" + (href if href.startswith('/') else "/cht/8/" + href)
+            break
+    
+    if not ods_url:
+        match = re.search(r'href="([^"]*專營期貨商簡明財務資料表[^"]*\.ods)"', resp.text)
+        if match:
+            href = match.group(1)
+            ods_url = href if href.startswith('http') else "https://www.taifex.com.tw" + (href if href.startswith('/') else "/cht/8/" + href)
+    return ods_url
 
-        if not ods_url:
-            print("Could not find ODS URL for ANC Ratio.")
-            return None
-            
-        print(f"Downloading ODS from: {ods_url}")
-        ods_resp = requests.get(ods_url, timeout=20)
+def _ods_numbers(values):
+    """轉為數值；回傳 (數值, 是否可轉換)。原本就是空值的儲存格視為可轉換（NaN）"""
+    numbers = pd.to_numeric(values.astype(str).str.replace(',', '').str.strip(), errors='coerce')
+    return numbers, numbers.notna() | values.isna()
+
+def parse_broker_table(df):
+    """
+    以列標籤直接定位「期貨商名稱」、「資產合計」、「ANC比率(%)」三列，向量化轉成期貨商表格
+
+    Args:
+        df: ODS 原始表格（header=None 讀入）
+
+    Returns:
+        DataFrame[Broker, Asset, ANC]（ANC 為百分比數值，例如 539.0）；找不到必要的列時為 None
+    """
+    header_rows = df.index[df.eq('期貨商名稱').any(axis=1)]
+    labels = df[0].astype(str).str.replace('\n', '').str.replace(' ', '')
+    asset_rows = labels.index[labels == '資產合計']
+    anc_rows = labels.index[labels.str.contains('ANC比率(%)', regex=False)]
+    if header_rows.empty or asset_rows.empty or anc_rows.empty:
+        print(f"Could not find rows: Header={list(header_rows)}, Asset={list(asset_rows)}, ANC={list(anc_rows)}")
+        return None
+    
+    brokers = df.loc[header_rows[0]].iloc[1:]
+    assets, asset_ok = _ods_numbers(df.loc[asset_rows[-1]].iloc[1:])
+    raw_anc = df.loc[anc_rows[-1]].iloc[1:]
+    anc, anc_ok = _ods_numbers(raw_anc.astype(str).str.replace(' ', '').str.replace('%', ''))
+    anc_ok = anc_ok | raw_anc.isna()
+    # 🌟 ANC 讀取邏輯：帶 % 的直接使用；ODS 的 5.39 這種小數乘以 100 變成 539.0
+    is_percent = raw_anc.astype(str).str.contains('%', regex=False)
+    anc = anc.where(is_percent | ~(anc < 200), anc * 100)
+    
+    broker_text = brokers.astype(str)
+    keep = (
+        brokers.notna() & ~broker_text.str.contains('合計') & ~broker_text.str.contains('總計')
+        & asset_ok & anc_ok
+    )
+    return pd.DataFrame({'Broker': brokers[keep], 'Asset': assets[keep], 'ANC': anc[keep]}).reset_index(drop=True)
+
+def load_broker_table(ods_url):
+    """
+    取得期貨商表格：同一個 ODS 網址、或內容雜湊相同時直接使用上次解析的結果，
+    只有出現新檔案時才下載並用 odfpy 解析
+
+    Returns:
+        parse_broker_table() 的表格；無法解析時為 None
+    """
+    state = {}
+    if os.path.exists(FCM_CACHE_STATE) and os.path.exists(FCM_CACHE_TABLE):
+        with open(FCM_CACHE_STATE, encoding='utf-8') as f:
+            state = json.load(f)
+    if state.get('ods_url') == ods_url:
+        print(f"Using cached broker table for {ods_url}")
+        return pd.read_csv(FCM_CACHE_TABLE)
+    
+    print(f"Downloading ODS from: {ods_url}")
+    ods_resp = cached_get(ods_url, ttl=FCM_ODS_TTL, timeout=20)
+    ods_resp.raise_for_status()
+    content_hash = hashlib.sha256(ods_resp.content).hexdigest()
+    if state.get('sha256') == content_hash:
+        print("ODS content unchanged, using cached broker table.")
+        table = pd.read_csv(FCM_CACHE_TABLE)
+    else:
         try:
             df = pd.read_excel(BytesIO(ods_resp.content), engine='odf', header=None)
         except ImportError:
             print("Error: 'odfpy' library is required to read ODS files.")
             return None
-            
-        header_row_idx = None
-        for idx, row in df.iterrows():
-            if '期貨商名稱' in row.values:
-                header_row_idx = idx
-                break
+        table = parse_broker_table(df)
+        if table is None:
+            return None
+    
+    os.makedirs(os.path.dirname(FCM_CACHE_TABLE), exist_ok=True)
+    table.to_csv(FCM_CACHE_TABLE, index=False)
+    with open(FCM_CACHE_STATE, 'w', encoding='utf-8') as f:
+        json.dump({'ods_url': ods_url, 'sha256': content_hash}, f, ensure_ascii=False, indent=2)
+    return table
+
+def get_anc_ratio():
+    """從期交所 ODS 檔解析：全市場 ANC 最低值、與前四大期貨商 ANC 最低值"""
+    try:
+        ods_url = find_fcm_ods_url()
+        if not ods_url:
+            print("Could not find ODS URL for ANC Ratio.")
+            return None
         
-        if header_row_idx is not None:
-            brokers = df.iloc[header_row_idx].values[1:]
-            asset_row_idx, anc_row_idx = None, None
-            for idx, row in df.iterrows():
-                row_val = str(row.values[0]).replace('\n', '').replace(' ', '')
-                if '資產合計' == row_val: asset_row_idx = idx
-                if 'ANC比率(%)' in row_val: anc_row_idx = idx
-            
-            if asset_row_idx is not None and anc_row_idx is not None:
-                assets = df.iloc[asset_row_idx].values[1:]
-                ancs = df.iloc[anc_row_idx].values[1:]
-                data = []
-                for b, a, anc in zip(brokers, assets, ancs):
-                    if pd.isna(b) or '合計' in str(b) or '總計' in str(b): continue
-                    try:
-                        asset_val = float(str(a).replace(',', ''))
-                        
-                        # 🌟 修正版 ANC 讀取邏輯 (完美轉換 539%)
-                        raw_anc = str(anc).replace(' ', '')
-                        if '%' in raw_anc:
-                            anc_val = float(raw_anc.replace('%', '').replace(',', ''))
-                        else:
-                            anc_val = float(raw_anc.replace(',', ''))
-                            if anc_val < 200: # ODS 的 5.39 會在這裡乘以 100 變成 539.0
-                                anc_val = anc_val * 100
-                                
-                        data.append({'Broker': b, 'Asset': asset_val, 'ANC': anc_val})
-                    except: continue
-                
-                res_df = pd.DataFrame(data)
-                if res_df.empty:
-                    print("ANC data parsing resulted in empty DataFrame.")
-                    return None
-                
-                top_4 = res_df.sort_values(by='Asset', ascending=False).head(4)
-                print(f"Top 4 Brokers for ANC: {top_4['Broker'].tolist()}")
-                
-                min_anc_all = round(res_df['ANC'].min(), 2)
-                min_anc_top4 = round(top_4['ANC'].min(), 2)
-                
-                return {
-                    'ANC_Ratio_Min': min_anc_all,
-                    'ANC_Ratio_Min_Top4': min_anc_top4
-                }
-            else:
-                print(f"Could not find rows: Asset={asset_row_idx}, ANC={anc_row_idx}")
+        res_df = load_broker_table(ods_url)
+        if res_df is None:
+            return None
+        if res_df.empty:
+            print("ANC data parsing resulted in empty DataFrame.")
+            return None
+        
+        top_4 = res_df.sort_values(by='Asset', ascending=False).head(4)
+        print(f"Top 4 Brokers for ANC: {top_4['Broker'].tolist()}")
+        
+        min_anc_all = round(res_df['ANC'].min(), 2)
+        min_anc_top4 = round(top_4['ANC'].min(), 2)
+        
+        return {
+            'ANC_Ratio_Min': min_anc_all,
+            'ANC_Ratio_Min_Top4': min_anc_top4
+        }
     except Exception as e:
         print(f"Error fetching ANC Ratio: {e}")
     return None
@@ -164,17 +220,51 @@ def get_cp_rate():
         print(f"Error fetching CP Rate: {e}")
     return None
 
+def fetch_all_sources():
+    """
+    同時執行四個抓取函式，總執行時間取決於最慢的來源而不是加總
+
+    Returns:
+        dict: {'tx', 'margin', 'cp', 'anc'} -> 各函式的回傳值；
+              失敗或超過 SOURCE_DEADLINES 時與原本相同（tx 為兩個 None 的 dict，其他為 None）
+    """
+    sources = {
+        'tx': (get_tx_futures, {'tx_price': None, 'tx_oi': None}),
+        'margin': (get_margin_balance, None),
+        'cp': (get_cp_rate, None),
+        'anc': (get_anc_ratio, None),
+    }
+    started = time.monotonic()
+    pool = ThreadPoolExecutor(max_workers=len(sources))
+    futures = {name: pool.submit(func) for name, (func, _) in sources.items()}
+
+    results = {}
+    for name in sorted(futures, key=SOURCE_DEADLINES.get):
+        remaining = max(0, started + SOURCE_DEADLINES[name] - time.monotonic())
+        try:
+            results[name] = futures[name].result(timeout=remaining)
+        except FutureTimeoutError:
+            print(f"Timed out fetching {name} after {SOURCE_DEADLINES[name]}s")
+            results[name] = sources[name][1]
+        except Exception as e:
+            print(f"Error fetching {name}: {e}")
+            results[name] = sources[name][1]
+    # 逾時的請求仍受各自的 requests timeout 限制，不等它們結束
+    pool.shutdown(wait=False, cancel_futures=True)
+    return results
+
 def main():
     tz_offset = datetime.timezone(datetime.timedelta(hours=8))
     now = datetime.datetime.now(tz_offset)
     today = now.strftime('%Y-%m-%d')
     print(f"--- Market Monitor Started: {now.strftime('%Y-%m-%d %H:%M:%S')} (Taipei) ---")
     
-    tx_data = get_tx_futures()
-    margin_balance = get_margin_balance()
-    cp_rate = get_cp_rate()
+    results = fetch_all_sources()
+    tx_data = results['tx']
+    margin_balance = results['margin']
+    cp_rate = results['cp']
     
-    anc_data = get_anc_ratio()
+    anc_data = results['anc']
     if anc_data is None:
         anc_data = {'ANC_Ratio_Min': None, 'ANC_Ratio_Min_Top4': None}
     elif isinstance(anc_data, (float, int)):